@@ -1,23 +1,115 @@
+import argparse
 import asyncio
 import logging
+import random
+from datetime import datetime, timezone
 from asyncua import ua
 from asyncua.server import Server, EventGenerator
 
 logging.basicConfig(level=logging.INFO)
 _logger = logging.getLogger('asyncua')
 
+# 부하 생성용 변수 타입 (이름 → VariantType, 배열 여부)
+VARIABLE_TYPES = {
+    "double": (ua.VariantType.Double, False),
+    "float": (ua.VariantType.Float, False),
+    "int32": (ua.VariantType.Int32, False),
+    "uint64": (ua.VariantType.UInt64, False),
+    "boolean": (ua.VariantType.Boolean, False),
+    "double_array": (ua.VariantType.Double, True),
+    "int32_array": (ua.VariantType.Int32, True),
+}
 
-async def main():
+# 값 변화 패턴
+PATTERN_RANDOM_WALK = "random_walk"
+PATTERN_SAWTOOTH = "sawtooth"
+SAWTOOTH_PERIOD = 100
+
+
+class LoadVariable:
+    def __init__(self, node, variant_type, is_array, size, offset):
+        self.nodeid = node.nodeid
+        self.variant_type = variant_type
+        self.is_array = is_array
+        # 배열이면 원소마다, 아니면 값 하나의 상태 (float로 두고 쓸 때 타입에 맞게 변환)
+        self.state = [float(offset + i) for i in range(size if is_array else 1)]
+
+    def step(self, pattern, tick):
+        if pattern == PATTERN_SAWTOOTH:
+            self.state = [float((tick + i) % SAWTOOTH_PERIOD) for i in range(len(self.state))]
+        else:
+            self.state = [x + random.gauss(0.0, 1.0) for x in self.state]
+
+    def make_variant(self):
+        vt = self.variant_type
+        if vt == ua.VariantType.Boolean:
+            values = [x > 0 if self.is_array else int(x) % 2 == 1 for x in self.state]
+        elif vt == ua.VariantType.Int32:
+            values = [int(x) for x in self.state]
+        elif vt == ua.VariantType.UInt64:
+            values = [abs(int(x)) for x in self.state]
+        else:
+            values = self.state
+        return ua.Variant(values if self.is_array else values[0], vt)
+
+
+def make_variable_value(variant_type, is_array, size):
+    default = False if variant_type == ua.VariantType.Boolean else 0
+    if variant_type in (ua.VariantType.Double, ua.VariantType.Float):
+        default = 0.0
+    return ua.Variant([default] * size if is_array else default, variant_type)
+
+
+# 같은 주기의 변수들을 한 번의 Write 서비스 호출로 갱신 (변수마다 write_value를 부르지 않음)
+async def update_loop(server, variables, interval, pattern, stop_flag):
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+    tick = 0
+    while True:
+        next_tick += interval
+        await asyncio.sleep(max(0.0, next_tick - loop.time()))
+        if await stop_flag.read_value():
+            continue
+        tick += 1
+        now = datetime.now(timezone.utc)
+        params = ua.WriteParameters()
+        for variable in variables:
+            variable.step(pattern, tick)
+            params.NodesToWrite.append(ua.WriteValue(
+                NodeId=variable.nodeid,
+                AttributeId=ua.AttributeIds.Value,
+                Value=ua.DataValue(variable.make_variant(), SourceTimestamp=now, ServerTimestamp=now),
+            ))
+        await server.iserver.attribute_service.write(params)
+
+
+async def event_loop(myevgen, mysecondevgen, interval, stop_flag):
+    count = 0
+    while True:
+        await asyncio.sleep(interval)
+        if await stop_flag.read_value():
+            continue
+        myevgen.event.Message = ua.LocalizedText("MyFirstEvent %d" % count)
+        myevgen.event.Severity = count
+        myevgen.event.MyNumericProperty = count
+        myevgen.event.MyStringProperty = "Property %d" % count
+        #   클라이언트에게 이벤트 전송
+        await myevgen.trigger()
+        await mysecondevgen.trigger(message="MySecondEvent %d" % count)
+        count += 1
+
+
+async def main(args):
     server = Server()
 
     #	클라이언트가 접속할 주소 설정
     await server.init()
-    server.set_endpoint("opc.tcp://0.0.0.0:4840")                   ## OPC UA 프로토콜로 접속 가능한 서버를 시작. ip 0.0.0.0으로 설정해서 모든 네트워크 인터페이스에서 접근 허용
-    
+    server.set_endpoint(args.endpoint)                              ## OPC UA 프로토콜로 접속 가능한 서버를 시작. ip 0.0.0.0으로 설정해서 모든 네트워크 인터페이스에서 접근 허용
+
     #   사용자 네임스페이스 (URI 기반) 등록
-    uri = "http://lee-eunseo-opcua.local"                           ## OPC UA의 노드공간인 namespace를 등록하고, 
+    uri = "http://lee-eunseo-opcua.local"                           ## OPC UA의 노드공간인 namespace를 등록하고,
     idx = await server.register_namespace(uri)
-    
+
     #   MyObject라는 노드(=디바이스/장비) 생성
     myobj = await server.nodes.objects.add_object(idx, "MyObject")  ## 그 아래에 변수 Count를 MYObject라는 노드 안에 생성
     #   그 안에 Count라는 송신 변수와 stop_flag라는 수신 변수 추가
@@ -25,10 +117,34 @@ async def main():
     stop_flag = await myobj.add_variable(idx, "StopFlag", False, ua.VariantType.Boolean)
     await stop_flag.set_writable()  # 클라이언트가 쓸 수 있도록 설정
 
-
+    #   부하 생성용 객체/변수: Load_{o}/{type}_{v}, NodeId는 ns=2;s=Load_{o}.{type}_{v}
+    #   타입과 갱신 주기는 변수 순서대로 돌아가며 배정
+    types = [t.strip() for t in args.types.split(",") if t.strip()]
+    intervals_ms = [float(r) for r in args.intervals_ms.split(",") if r.strip()]
+    groups = {}
+    for o in range(args.objects):
+        obj = await server.nodes.objects.add_object(ua.NodeId(f"Load_{o}", idx), f"Load_{o}")
+        for v in range(args.variables):
+            type_name = types[v % len(types)]
+            variant_type, is_array = VARIABLE_TYPES[type_name]
+            browse_name = f"{type_name}_{v}"
+            node = await obj.add_variable(
+                ua.NodeId(f"Load_{o}.{browse_name}", idx), browse_name,
+                make_variable_value(variant_type, is_array, args.array_size), variant_type
+            )
+            if is_array:
+                await node.write_array_dimensions([args.array_size])
+            interval = intervals_ms[(o * args.variables + v) % len(intervals_ms)] / 1000
+            groups.setdefault(interval, []).append(
+                LoadVariable(node, variant_type, is_array, args.array_size, o * args.variables + v)
+            )
+    total = args.objects * args.variables
+    if total:
+        offered = sum(len(g) / interval for interval, g in groups.items())
+        _logger.info("load generator: %d variables, %.0f value changes/s (%s)", total, offered, args.pattern)
 
     #   사용자 정의 이벤트 타입 생성 (MyFirstEvent)
-    etype = await server.create_custom_event_type(        
+    etype = await server.create_custom_event_type(
         idx, 'MyFirstEvent', ua.ObjectIds.BaseEventType,
         [('MyNumericProperty', ua.VariantType.Float),
          ('MyStringProperty', ua.VariantType.String)]
@@ -44,6 +160,13 @@ async def main():
     mysecondevgen = await server.get_event_generator(custom_etype, myobj)
 
     async with server:
+        tasks = [
+            asyncio.create_task(update_loop(server, variables, interval, args.pattern, stop_flag))
+            for interval, variables in groups.items()
+        ]
+        if args.event_rate > 0:
+            tasks.append(asyncio.create_task(event_loop(myevgen, mysecondevgen, 1 / args.event_rate, stop_flag)))
+
         count = 0
         while True:
             await asyncio.sleep(.1)
@@ -53,17 +176,26 @@ async def main():
             if stop:
                 continue  # stop이면 count 증가 안 함
 
-            myevgen.event.Message = ua.LocalizedText("MyFirstEvent %d" % count)
-            myevgen.event.Severity = count
-            myevgen.event.MyNumericProperty = count
-            myevgen.event.MyStringProperty = "Property %d" % count
-            #   클라이언트에게 이벤트 전송
-            await myevgen.trigger()
-            await mysecondevgen.trigger(message="MySecondEvent %d" % count)
             #   Count 변수 값 주기적으로 갱신
             await var.write_value(ua.Variant(count, ua.VariantType.UInt64))
             count += 1
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="OPC UA test server / load generator")
+    parser.add_argument("--endpoint", default="opc.tcp://0.0.0.0:4840")
+    parser.add_argument("--objects", type=int, default=0, help="number of Load_N objects (0 = only MyObject)")
+    parser.add_argument("--variables", type=int, default=100, help="variables per object")
+    parser.add_argument("--types", default="double",
+                        help=f"comma separated variable types, assigned round-robin ({', '.join(VARIABLE_TYPES)})")
+    parser.add_argument("--array-size", type=int, default=10, help="length of *_array variables")
+    parser.add_argument("--intervals-ms", default="100",
+                        help="comma separated update intervals in ms, assigned round-robin (e.g. 100,1000)")
+    parser.add_argument("--pattern", choices=(PATTERN_RANDOM_WALK, PATTERN_SAWTOOTH), default=PATTERN_RANDOM_WALK)
+    parser.add_argument("--event-rate", type=float, default=10.0,
+                        help="MyFirstEvent/MySecondEvent pairs per second (0 = no events)")
+    args = parser.parse_args()
+    unknown = [t for t in args.types.split(",") if t.strip() and t.strip() not in VARIABLE_TYPES]
+    if unknown:
+        parser.error(f"unknown variable type(s): {unknown}")
+    asyncio.run(main(args))
@@ -0,0 +1,339 @@
+# bench_pipeline.py
+# 인터넷 없이 돌릴 수 있는 파이프라인 벤치마크
+# 로컬 asyncua 서버(변수 N개를 초당 R번 변경)와 MQTT 브로커 대용(stand-in)을 각각 별도 프로세스로 띄우고,
+# 또 다른 프로세스에서 실제 opcua_client/publisher 경로를 돌려서 msg/s, 지연(p50/p99), CPU, RSS를 측정함
+# (서버가 CPU를 많이 쓰므로 브로커와 같은 프로세스에 두면 ACK가 늦어져서 브리지 성능이 낮게 나옴)
+# 결과는 --output 파일(JSON Lines)에 한 줄씩 추가 (git commit 포함 → 커밋 사이 회귀 비교용)
+#
+# 실행: python bench_pipeline.py --variables 1000 --rate 10 --duration 30
+from sys import platform
+from os import name
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import subprocess
+import time
+from datetime import datetime, timezone
+
+from asyncua import Server, ua
+
+BENCH_HOST = "127.0.0.1"
+
+
+####################################################################################
+# MQTT broker stand-in:
+####################################################################################
+# MQTT 3.1.1에서 브리지가 쓰는 패킷만 처리하는 최소 브로커
+# CONNECT, PUBLISH(QoS 0/1), SUBSCRIBE, PINGREQ, DISCONNECT. 구독자에게는 QoS 0으로 전달
+def _encode_length(n):
+    out = bytearray()
+    while True:
+        digit = n % 128
+        n //= 128
+        out.append(digit | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+def _topic_matches(topic_filter, topic):
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+class MqttBrokerStub:
+    def __init__(self, received=None):
+        # 받은 PUBLISH 수 (multiprocessing.Value를 넘기면 다른 프로세스에서도 읽을 수 있음)
+        self.received = received
+        self.count = 0
+        self.subscribers = {}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # 한 번에 읽은 데이터에서 완성된 패킷을 모두 처리하고 응답도 모아서 보냄 (패킷마다 drain하지 않음)
+        buffer = b""
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buffer += data
+                pos = 0
+                while True:
+                    packet = self.next_packet(buffer, pos)
+                    if packet is None:
+                        break
+                    header, body, pos = packet
+                    packet_type = header >> 4
+                    if packet_type == 3:    # PUBLISH
+                        self.on_publish(writer, header, body)
+                    elif packet_type == 1:  # CONNECT
+                        writer.write(b"\x20\x02\x00\x00")
+                    elif packet_type == 8:  # SUBSCRIBE
+                        self.on_subscribe(writer, body)
+                    elif packet_type == 12: # PINGREQ
+                        writer.write(b"\xd0\x00")
+                    elif packet_type == 14: # DISCONNECT
+                        return
+                buffer = buffer[pos:]
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.subscribers.pop(writer, None)
+            writer.close()
+
+    # buffer[pos:]에 완성된 패킷이 있으면 (header, body, 다음 위치), 없으면 None
+    @staticmethod
+    def next_packet(buffer, pos):
+        end = len(buffer)
+        if pos + 2 > end:
+            return None
+        header = buffer[pos]
+        length, multiplier, i = 0, 1, pos + 1
+        while True:
+            if i >= end:
+                return None
+            digit = buffer[i]
+            length += (digit & 0x7F) * multiplier
+            multiplier *= 128
+            i += 1
+            if not digit & 0x80:
+                break
+        if i + length > end:
+            return None
+        return header, buffer[i:i + length], i + length
+
+    def on_publish(self, writer, header, body):
+        qos = (header >> 1) & 0x03
+        topic_length = int.from_bytes(body[:2], "big")
+        topic = body[2:2 + topic_length].decode()
+        pos = 2 + topic_length
+        if qos:
+            writer.write(b"\x40\x02" + body[pos:pos + 2])
+            pos += 2
+        self.count += 1
+        if self.received is not None:
+            self.received.value = self.count
+        for subscriber, filters in self.subscribers.items():
+            if any(_topic_matches(f, topic) for f in filters):
+                packet = body[:2 + topic_length] + body[pos:]
+                subscriber.write(b"\x30" + _encode_length(len(packet)) + packet)
+
+    def on_subscribe(self, writer, body):
+        packet_id = body[:2]
+        filters = self.subscribers.setdefault(writer, [])
+        granted = bytearray()
+        pos = 2
+        while pos < len(body):
+            filter_length = int.from_bytes(body[pos:pos + 2], "big")
+            filters.append(body[pos + 2:pos + 2 + filter_length].decode())
+            pos += 2 + filter_length + 1
+            granted.append(0)
+        writer.write(b"\x90" + _encode_length(2 + len(granted)) + packet_id + bytes(granted))
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+####################################################################################
+# OPC UA server stand-in:
+####################################################################################
+async def run_load_server(port, variables, rate):
+    server = Server()
+    await server.init()
+    server.set_endpoint(f"opc.tcp://{BENCH_HOST}:{port}")
+    idx = await server.register_namespace("http://bench.opcua-sub-to-mqtt")
+    obj = await server.nodes.objects.add_object(idx, "Bench")
+    nodes = [await obj.add_variable(ua.NodeId(f"V{i}", idx), f"V{i}", 0.0) for i in range(variables)]
+    async with server:
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / rate
+        next_tick = loop.time()
+        tick = 0
+        while True:
+            tick += 1
+            now = datetime.now(timezone.utc)
+            for i, node in enumerate(nodes):
+                dv = ua.DataValue(
+                    ua.Variant(float(tick + i), ua.VariantType.Double),
+                    SourceTimestamp=now, ServerTimestamp=now
+                )
+                await server.write_attribute_value(node.nodeid, dv)
+            next_tick += interval
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+def server_main(opcua_port, variables, rate):
+    try:
+        asyncio.run(run_load_server(opcua_port, variables, rate))
+    except KeyboardInterrupt:
+        pass
+
+def broker_main(mqtt_port, received):
+    try:
+        asyncio.run(MqttBrokerStub(received).serve(BENCH_HOST, mqtt_port))
+    except KeyboardInterrupt:
+        pass
+
+
+####################################################################################
+# Bridge under test:
+####################################################################################
+def read_rss_mb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1e6
+    except ImportError:
+        pass
+    try:
+        import resource
+        # Linux는 KB 단위, 최대 사용량(peak)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return None
+
+async def measure_bridge(args, results):
+    import opcua_client_mqtt_publisher as bridge
+    from bridge_metrics import metrics, LATENCY_STAGES, LatencyHistogram
+
+    bridge.broker_ip = BENCH_HOST
+    bridge.broker_port = args.mqtt_port
+    bridge.mqtt_connections = args.mqtt_connections
+    nodes = [
+        {"nodeid": f"ns=2;s=V{i}", "publishing_class": args.publishing_class}
+        for i in range(args.variables)
+    ]
+    config = {
+        "server_tag": "bench",
+        "server_url": f"opc.tcp://{BENCH_HOST}:{args.opcua_port}",
+        "nodes_to_subscribe": nodes,
+        "events_to_subscribe": [],
+    }
+    task = asyncio.create_task(bridge.main([config]))
+    await asyncio.sleep(args.warmup)
+
+    # 워밍업 구간은 빼고 측정
+    stats = metrics.server("bench")
+    stats.latency = {stage: LatencyHistogram() for stage in LATENCY_STAGES}
+    notifications = stats.notifications
+    published = bridge.publish_stats["published"]
+    errors = bridge.publish_stats["errors"]
+    cpu = time.process_time()
+    started = time.perf_counter()
+
+    await asyncio.sleep(args.duration)
+
+    elapsed = time.perf_counter() - started
+    latency = metrics.latency_stats("bench")["bench"]
+    results.put({
+        "elapsed_s": round(elapsed, 3),
+        "notifications_per_s": round((stats.notifications - notifications) / elapsed, 1),
+        "published_per_s": round((bridge.publish_stats["published"] - published) / elapsed, 1),
+        "publish_errors": bridge.publish_stats["errors"] - errors,
+        "latency_p50_ms": latency["end_to_end"].get("p50_ms"),
+        "latency_p99_ms": latency["end_to_end"].get("p99_ms"),
+        "latency_stages": latency,
+        "cpu_percent": round((time.process_time() - cpu) / elapsed * 100, 1),
+        "rss_mb": round(read_rss_mb() or 0, 1),
+        "queue": bridge.mqtt_queue.stats(),
+    })
+    task.cancel()
+
+def bridge_main(args, results):
+    try:
+        asyncio.run(measure_bridge(args, results))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+####################################################################################
+# Run:
+####################################################################################
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_benchmark(args):
+    ctx = multiprocessing.get_context("spawn")
+    received = ctx.Value("q", 0)
+    results = ctx.Queue()
+
+    stand_ins = [
+        ctx.Process(target=server_main, args=(args.opcua_port, args.variables, args.rate), daemon=True),
+        ctx.Process(target=broker_main, args=(args.mqtt_port, received), daemon=True),
+    ]
+    for process in stand_ins:
+        process.start()
+    # 서버가 변수 N개를 만들 때까지 기다림
+    time.sleep(args.startup)
+    if not all(process.is_alive() for process in stand_ins):
+        for process in stand_ins:
+            process.terminate()
+        raise SystemExit("test server / broker stand-in exited (port already in use?)")
+
+    bridge_process = ctx.Process(target=bridge_main, args=(args, results), daemon=True)
+    bridge_process.start()
+    try:
+        time.sleep(args.warmup)
+        broker_start = received.value
+        result = results.get(timeout=args.duration + 60)
+        broker_received = received.value - broker_start
+    finally:
+        for process in [bridge_process] + stand_ins:
+            process.terminate()
+            process.join()
+
+    result["broker_received_per_s"] = round(broker_received / result["elapsed_s"], 1)
+    return {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "params": {
+            "variables": args.variables,
+            "rate": args.rate,
+            "offered_per_s": args.variables * args.rate,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "publishing_class": args.publishing_class,
+            "mqtt_connections": args.mqtt_connections,
+        },
+        "results": result,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="offline throughput/latency benchmark for the OPC UA → MQTT bridge")
+    parser.add_argument("--variables", type=int, default=1000, help="number of Double variables on the test server")
+    parser.add_argument("--rate", type=float, default=10.0, help="value changes per second per variable")
+    parser.add_argument("--duration", type=float, default=30.0, help="measurement time in seconds")
+    parser.add_argument("--warmup", type=float, default=10.0, help="seconds to run before measuring")
+    parser.add_argument("--startup", type=float, default=5.0, help="seconds to wait for the test server")
+    parser.add_argument("--publishing-class", default="fast", help="publishing class used for all variables")
+    parser.add_argument("--mqtt-connections", type=int, default=1, help="size of the bridge's MQTT connection pool")
+    parser.add_argument("--opcua-port", type=int, default=48500)
+    parser.add_argument("--mqtt-port", type=int, default=18830)
+    parser.add_argument("--output", default="bench_pipeline_results.jsonl", help="JSON Lines file to append the result to")
+    args = parser.parse_args()
+
+    if platform.lower() == "win32" or name.lower() == "nt":
+        from asyncio import (
+            set_event_loop_policy,
+            WindowsSelectorEventLoopPolicy
+        )
+        set_event_loop_policy(WindowsSelectorEventLoopPolicy())
+
+    record = run_benchmark(args)
+    print(json.dumps(record, indent=2))
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
@@ -0,0 +1,71 @@
+# bench_serializer.py
+# 기존 makeDictFromDataValue → json.dumps 경로와 DataValueJsonEncoder 속도 비교
+# 배열 값은 str(list)와 array_encoding "ndarray"(base64 블록)도 비교
+# 실행: python bench_serializer.py [반복 횟수]
+import sys
+import timeit
+from datetime import datetime, timezone
+
+from asyncua import ua
+
+from opcua_client_mqtt_publisher import makeDictFromDataValue, makeJsonStringFromDict
+from payload_codec import DataValueJsonEncoder, ARRAY_ENCODING_NDARRAY
+
+
+def make_samples():
+    aware = datetime.now(timezone.utc)
+    now = aware.replace(tzinfo=None)
+    return {
+        "Double": ua.DataValue(ua.Variant(21.53, ua.VariantType.Double), SourceTimestamp=now, ServerTimestamp=now),
+        "UInt64": ua.DataValue(ua.Variant(123456, ua.VariantType.UInt64), SourceTimestamp=now, ServerTimestamp=now),
+        "Boolean": ua.DataValue(ua.Variant(True, ua.VariantType.Boolean), SourceTimestamp=now, ServerTimestamp=now),
+        "String": ua.DataValue(ua.Variant('say "hi"', ua.VariantType.String), SourceTimestamp=now, ServerTimestamp=now),
+        "AwareTime": ua.DataValue(ua.Variant(-7, ua.VariantType.Int32), SourceTimestamp=aware, ServerTimestamp=aware),
+        "NoTimestamps": ua.DataValue(ua.Variant(1.0, ua.VariantType.Float)),
+    }
+
+
+def main(number=100000):
+    encoder = DataValueJsonEncoder()
+    for name, dv in make_samples().items():
+        old = makeJsonStringFromDict(makeDictFromDataValue(dv)).encode()
+        new = encoder.encode(name, dv)
+        if old != new:
+            raise SystemExit(f"[{name}] output differs!\n  old: {old}\n  new: {new}")
+
+        t_old = timeit.timeit(lambda: makeJsonStringFromDict(makeDictFromDataValue(dv)).encode(), number=number)
+        t_new = timeit.timeit(lambda: encoder.encode(name, dv), number=number)
+        print(
+            f"{name:<13} old: {number / t_old:>10,.0f} msg/s | "
+            f"new: {number / t_new:>10,.0f} msg/s | x{t_old / t_new:.1f}"
+        )
+
+
+def make_array_samples():
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    waveform = [float(i % 360) * 0.5 for i in range(10000)]
+    return {
+        "Float[10000]": ua.DataValue(ua.Variant(waveform, ua.VariantType.Float), SourceTimestamp=now),
+        "Double[10000]": ua.DataValue(ua.Variant(waveform, ua.VariantType.Double), SourceTimestamp=now),
+        "Int32[1000]": ua.DataValue(ua.Variant(list(range(1000)), ua.VariantType.Int32), SourceTimestamp=now),
+    }
+
+
+def main_arrays(number):
+    string_encoder = DataValueJsonEncoder()
+    ndarray_encoder = DataValueJsonEncoder(ARRAY_ENCODING_NDARRAY)
+    for name, dv in make_array_samples().items():
+        old = string_encoder.encode(name, dv)
+        new = ndarray_encoder.encode(name, dv)
+        t_old = timeit.timeit(lambda: string_encoder.encode(name, dv), number=number)
+        t_new = timeit.timeit(lambda: ndarray_encoder.encode(name, dv), number=number)
+        print(
+            f"{name:<13} string: {number / t_old:>8,.0f} msg/s {len(old):>8,} B | "
+            f"ndarray: {number / t_new:>8,.0f} msg/s {len(new):>8,} B | x{t_old / t_new:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    main(number)
+    main_arrays(max(1, number // 1000))
@@ -0,0 +1,247 @@
+# bridge_config.py
+# 브리지 설정 파일(JSON/TOML/YAML)과 노드 목록 CSV를 읽어서
+# opcua_client()에 바로 넘길 수 있는 server_configs 형태로 만듦
+import csv
+import json
+import os
+import re
+import time
+
+# 설정 파일 예시 (JSON):
+# {
+#     "broker": {"ip": "broker.hivemq.com", "port": 1883},
+#     "servers": [
+#         {
+#             "server_tag": "server_test",
+#             "server_url": "opc.tcp://127.0.0.1:4840",
+#             "nodes_to_subscribe": [
+#                 "ns=2;i=2",
+#                 {"nodeid": "ns=2;i=4", "sampling_interval": 500, "deadband_type": "absolute", "deadband_value": 0.5}
+#             ],
+#             "nodes_csv": "server_test_nodes.csv",
+#             "browse": {"root": "ns=2;s=Plant", "include": ["*/Line1/*"], "cache": "server_test.nodes.json"},
+#             "events_to_subscribe": [["ns=2;i=1", "ns=2;i=3"]]
+#         }
+#     ]
+# }
+# nodes_csv 경로는 설정 파일 위치 기준 상대 경로. CSV 첫 번째 열이 NodeId ('#' 주석 줄은 건너뜀)
+# 헤더 줄("nodeid,sampling_interval,queuesize,deadband_type,deadband_value,publishing_class,priority")이 있으면
+# 나머지 열은 노드별 설정 (priority: "high"/"alarm"이면 bulk 값보다 먼저 MQTT로 보냄)
+# "acquisition": "polling"이면 구독 대신 "poll_interval"(ms)마다 Read로 읽음 (subscription을 잘 처리하지 못하는 서버용)
+# "write_enabled": true면 demo/opcua-sub-to-mqtt/{server_tag}/write/{nodeid} 토픽으로 받은 값을 이 서버에 씀
+# browse가 있으면 root 아래 Variable 노드를 접속할 때 찾아서 추가로 구독 (node_discovery.py 참고, cache 경로도 설정 파일 기준)
+
+DEFAULT_BROKER_IP = "broker.hivemq.com"
+DEFAULT_BROKER_PORT = 1883
+
+_NODEID_PATTERN = re.compile(r"(?:ns=\d+;|nsu=[^;]+;)?[isgb]=.+")
+
+# server_configs 항목에서 그대로 넘겨주는 선택 키들
+_OPTIONAL_SERVER_KEYS = ("coalesce_window", "payload_codec", "array_encoding", "array_delta", "acquisition", "poll_interval", "write_enabled")
+
+
+def _read_config_file(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    if ext == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    if ext in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("YAML config needs the PyYAML package (pip install pyyaml)")
+        with open(path, "r", encoding="utf-8") as f:
+            return yaml.safe_load(f)
+    raise ValueError(f"unsupported config format: {path} (use .json, .toml, .yaml)")
+
+
+# 노드별 설정 열 (CSV 헤더 / 설정 파일 dict 키) → 값 변환 함수
+NODE_SETTING_COLUMNS = {
+    "sampling_interval": float,
+    "queuesize": int,
+    "deadband_type": str,
+    "deadband_value": float,
+    "publishing_class": str,
+    "priority": str,
+}
+_DEADBAND_TYPES = ("absolute", "percent")
+_PRIORITIES = ("alarm", "high", "bulk")
+
+
+# CSV 파일에서 NodeId 목록을 읽음
+# 헤더가 "nodeid,sampling_interval,queuesize,publishing_class"처럼 되어 있으면
+# 값이 있는 설정 열을 dict로 묶어서 {"nodeid": ..., "queuesize": ...} 형태로 돌려줌
+def load_nodes_csv(path):
+    nodes = []
+    columns = None
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if not row:
+                continue
+            nodeid = row[0].strip()
+            if not nodeid or nodeid.startswith("#"):
+                continue
+            if nodeid.lower() == "nodeid":
+                columns = [c.strip().lower() for c in row[1:]]
+                continue
+            if columns and len(row) > 1:
+                entry = None
+                for key, value in zip(columns, row[1:]):
+                    value = value.strip()
+                    if value and key in NODE_SETTING_COLUMNS:
+                        if entry is None:
+                            entry = {"nodeid": nodeid}
+                        entry[key] = value
+                if entry is not None:
+                    nodes.append(entry)
+                    continue
+            nodes.append(nodeid)
+    return nodes
+
+
+def _normalize_node_settings(server_tag, entry):
+    if "nodeid" not in entry:
+        raise ValueError(f"[{server_tag}] node entry without nodeid: {entry}")
+    unknown = set(entry) - set(NODE_SETTING_COLUMNS) - {"nodeid"}
+    if unknown:
+        raise ValueError(f"[{server_tag}] {entry['nodeid']}: unknown node setting(s) {sorted(unknown)}")
+    try:
+        normalized = {"nodeid": entry["nodeid"]}
+        for key, convert in NODE_SETTING_COLUMNS.items():
+            if entry.get(key) is not None:
+                normalized[key] = convert(entry[key])
+    except ValueError as e:
+        raise ValueError(f"[{server_tag}] {entry['nodeid']}: {e}")
+    if normalized.get("deadband_type", "absolute") not in _DEADBAND_TYPES:
+        raise ValueError(f"[{server_tag}] {entry['nodeid']}: deadband_type must be one of {list(_DEADBAND_TYPES)}")
+    if normalized.get("priority", "bulk") not in _PRIORITIES:
+        raise ValueError(f"[{server_tag}] {entry['nodeid']}: priority must be one of {list(_PRIORITIES)}")
+    return normalized
+
+
+_BROWSE_KEYS = ("root", "include", "exclude", "cache", "settings")
+
+
+def _normalize_browse(server_tag, browse, base_dir):
+    if not isinstance(browse, dict):
+        raise ValueError(f"[{server_tag}] browse must be a mapping")
+    unknown = set(browse) - set(_BROWSE_KEYS)
+    if unknown:
+        raise ValueError(f"[{server_tag}] unknown browse key(s) {sorted(unknown)}")
+    normalized = dict(browse)
+    if "root" in browse and _NODEID_PATTERN.fullmatch(str(browse["root"])) is None:
+        raise ValueError(f"[{server_tag}] invalid browse root: {browse['root']}")
+    for key in ("include", "exclude"):
+        patterns = browse.get(key) or []
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        normalized[key] = list(patterns)
+    if browse.get("cache"):
+        normalized["cache"] = os.path.join(base_dir, browse["cache"])
+    if browse.get("settings"):
+        settings = _normalize_node_settings(server_tag, dict(browse["settings"], nodeid=browse.get("root", "browse")))
+        del settings["nodeid"]
+        normalized["settings"] = settings
+    return normalized
+
+
+def _validate_nodes(server_tag, nodes):
+    match = _NODEID_PATTERN.fullmatch
+    nodeids = []
+    for i, node in enumerate(nodes):
+        if isinstance(node, dict):
+            node = nodes[i] = _normalize_node_settings(server_tag, node)
+            nodeids.append(node["nodeid"])
+        else:
+            nodeids.append(node)
+    bad = [n for n in nodeids if not isinstance(n, str) or match(n) is None]
+    if bad:
+        raise ValueError(f"[{server_tag}] invalid NodeId(s): {bad[:5]}{' ...' if len(bad) > 5 else ''}")
+    if len(set(nodeids)) != len(nodeids):
+        # 중복 노드는 한 번만 구독 (처음 나온 항목 유지)
+        first = {}
+        for nodeid, node in zip(nodeids, nodes):
+            first.setdefault(nodeid, node)
+        nodes = list(first.values())
+    return nodes
+
+
+def load_bridge_config(path):
+    """
+    Loads the bridge config file and returns
+    {"broker_ip": ..., "broker_port": ..., "server_configs": [...]}.
+    Every server config has the keys opcua_client() expects.
+    Prints how long the parse, CSV and validation steps took.
+    """
+    t_start = time.perf_counter()
+    raw = _read_config_file(path)
+    t_parsed = time.perf_counter()
+    if not isinstance(raw, dict):
+        raise ValueError(f"{path}: top level must be a mapping")
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    csv_time = 0.0
+    validate_time = 0.0
+    node_count = 0
+    seen_tags = set()
+    server_configs = []
+
+    for index, server in enumerate(raw.get("servers", [])):
+        server_tag = server.get("server_tag")
+        server_url = server.get("server_url")
+        if not server_tag or not server_url:
+            raise ValueError(f"{path}: servers[{index}] needs server_tag and server_url")
+        if server_tag in seen_tags:
+            raise ValueError(f"{path}: duplicate server_tag {server_tag!r}")
+        if not server_url.startswith("opc.tcp://"):
+            raise ValueError(f"[{server_tag}] server_url must start with opc.tcp://")
+        seen_tags.add(server_tag)
+
+        nodes = list(server.get("nodes_to_subscribe") or [])
+        if server.get("nodes_csv"):
+            t0 = time.perf_counter()
+            nodes.extend(load_nodes_csv(os.path.join(base_dir, server["nodes_csv"])))
+            csv_time += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        nodes = _validate_nodes(server_tag, nodes)
+        events = []
+        for event in server.get("events_to_subscribe") or []:
+            if len(event) != 2:
+                raise ValueError(f"[{server_tag}] events_to_subscribe entries need [source_node, event_type]")
+            events.append((event[0], event[1]))
+        validate_time += time.perf_counter() - t0
+        node_count += len(nodes)
+
+        config = {
+            "server_tag": server_tag,
+            "server_url": server_url,
+            "nodes_to_subscribe": nodes,
+            "events_to_subscribe": events,
+        }
+        for key in _OPTIONAL_SERVER_KEYS:
+            if key in server:
+                config[key] = server[key]
+        if server.get("browse"):
+            config["browse"] = _normalize_browse(server_tag, server["browse"], base_dir)
+        server_configs.append(config)
+
+    broker = raw.get("broker") or {}
+    t_end = time.perf_counter()
+    print(
+        f"[config] {path}: {len(server_configs)} servers, {node_count} nodes | "
+        f"parse {(t_parsed - t_start) * 1000:.1f} ms, csv {csv_time * 1000:.1f} ms, "
+        f"validate {validate_time * 1000:.1f} ms, total {(t_end - t_start) * 1000:.1f} ms"
+    )
+    return {
+        "broker_ip": broker.get("ip", DEFAULT_BROKER_IP),
+        "broker_port": int(broker.get("port", DEFAULT_BROKER_PORT)),
+        "server_configs": server_configs,
+    }
@@ -0,0 +1,284 @@
+# bridge_metrics.py
+# 브리지 파이프라인 상태를 Prometheus 텍스트 형식으로 보여주는 작은 로컬 HTTP 서버
+# 카운터는 일반 int 속성이라 datachange_notification마다 올려도 부담이 거의 없고,
+# 문자열 변환은 /metrics 요청이 올 때만 함
+import asyncio
+from bisect import bisect_left
+
+from shared_queue import send_queue, PRIORITY_NAMES
+
+# opcua_client 상태 머신의 case 번호 → 라벨
+STATE_NAMES = {
+    0: "idle",
+    1: "connecting",
+    2: "subscribing",
+    3: "running",
+    4: "teardown",
+    5: "resuming",
+}
+
+LANE_NAMES = {priority: lane for lane, priority in PRIORITY_NAMES.items()}
+
+# 퍼블리시 통계 (sharded_runner 등에서 worker별로 모아서 보여줌)
+publish_stats = {
+    "published": 0,
+    "errors": 0,
+}
+
+
+# 지연 시간 히스토그램의 버킷 상한(초). 버킷 수가 고정이라 메시지가 많아도 메모리는 늘지 않음
+# encode/queue 구간은 보통 1ms보다 짧으므로 10µs부터 둠
+LATENCY_BUCKETS = (
+    0.00001, 0.00002, 0.00005, 0.0001, 0.0002, 0.0005,
+    0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+    1.0, 2.0, 5.0, 10.0, 30.0, 60.0,
+)
+
+# MqttMessage에 찍힌 시각으로 나눈 구간
+#   end_to_end : SourceTimestamp → 브로커 ACK
+#   opcua      : SourceTimestamp → datachange_notification 수신 (sampling/publishing interval + 네트워크)
+#   encode     : 수신 → send_queue에 넣기 (인코딩, coalesce_window 대기 포함)
+#   queue      : send_queue에 넣기 → publisher가 꺼내기
+#   broker     : 꺼내기 → 브로커 ACK (pipelined window 대기 포함)
+LATENCY_STAGES = ("end_to_end", "opcua", "encode", "queue", "broker")
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # 마지막 칸은 +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        # 보간한 분위수가 실제로 관측한 범위를 벗어나지 않도록 씀
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds):
+        # 서버와 시계가 어긋나서 음수가 나오면 0으로 봄
+        if seconds < 0:
+            seconds = 0.0
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    # 버킷 안에서 선형 보간한 q 분위수(초). 데이터가 없으면 None
+    def quantile(self, q):
+        if not self.count:
+            return None
+        return min(max(self._interpolate(q), self.min), self.max)
+
+    def _interpolate(self, q):
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+            if i < len(self.buckets):
+                lower = self.buckets[i]
+        return self.buckets[-1]
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count * 1000, 3),
+            "p50_ms": round(self.quantile(0.5) * 1000, 3),
+            "p90_ms": round(self.quantile(0.9) * 1000, 3),
+            "p99_ms": round(self.quantile(0.99) * 1000, 3),
+        }
+
+
+class ServerStats:
+    def __init__(self):
+        self.notifications = 0
+        self.events = 0
+        self.state = 0
+        # case 번호 → 그 상태로 들어간 횟수
+        self.state_entries = {}
+        self.latency = {stage: LatencyHistogram() for stage in LATENCY_STAGES}
+
+    def enter_state(self, case):
+        self.state = case
+        self.state_entries[case] = self.state_entries.get(case, 0) + 1
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class BridgeMetrics:
+    def __init__(self):
+        self.servers = {}
+        self.loop_lag = 0.0
+        self.loop_lag_max = 0.0
+        # mqtt_connections > 1일 때 MqttConnectionPool (연결별 통계)
+        self.mqtt_pool = None
+
+    # server_tag별 통계 객체 (핸들러와 opcua_client가 같은 객체를 공유)
+    def server(self, server_tag):
+        stats = self.servers.get(server_tag)
+        if stats is None:
+            stats = self.servers[server_tag] = ServerStats()
+        return stats
+
+    def render(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if labels:
+                    label_text = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+                    lines.append(f"{name}{{{label_text}}} {value}")
+                else:
+                    lines.append(f"{name} {value}")
+
+        servers = sorted(self.servers.items())
+        metric("opcua_bridge_notifications_total", "counter", "Data change notifications received.",
+               [({"server": tag}, s.notifications) for tag, s in servers])
+        metric("opcua_bridge_events_total", "counter", "Event notifications received.",
+               [({"server": tag}, s.events) for tag, s in servers])
+        metric("opcua_bridge_state", "gauge", "Current case of the opcua_client state machine.",
+               [({"server": tag, "state": STATE_NAMES.get(s.state, s.state)}, s.state) for tag, s in servers])
+        metric("opcua_bridge_state_entries_total", "counter", "Times the opcua_client state machine entered a case.",
+               [({"server": tag, "state": STATE_NAMES.get(case, case)}, count)
+                for tag, s in servers for case, count in sorted(s.state_entries.items())])
+
+        # send_queue 버스의 consumer(mqtt, gui 등)마다 따로
+        bus = send_queue.stats()
+        consumers = sorted(bus["consumers"].items())
+        metric("opcua_bridge_send_queue_messages_total", "counter", "Messages put on the send_queue bus.",
+               [(None, bus["published"])])
+        metric("opcua_bridge_send_queue_depth", "gauge", "Messages waiting in a send_queue consumer queue.",
+               [({"consumer": name}, queue["depth"]) for name, queue in consumers])
+        metric("opcua_bridge_send_queue_high_water", "gauge", "Largest consumer queue depth seen.",
+               [({"consumer": name}, queue["high_water"]) for name, queue in consumers])
+        metric("opcua_bridge_send_queue_lane_depth", "gauge", "Messages waiting in a consumer queue per priority lane.",
+               [({"consumer": name, "lane": LANE_NAMES.get(lane, lane)}, depth)
+                for name, queue in consumers for lane, depth in queue["lanes"].items()])
+        metric("opcua_bridge_send_queue_dropped_total", "counter",
+               "Messages a consumer lost to its overflow policy because it fell behind.",
+               [({"consumer": name}, queue["dropped"]) for name, queue in consumers])
+
+        metric("opcua_bridge_published_total", "counter", "Messages acknowledged by the MQTT broker.",
+               [(None, publish_stats["published"])])
+        metric("opcua_bridge_publish_errors_total", "counter", "Failed MQTT publishes.",
+               [(None, publish_stats["errors"])])
+
+        lines.append("# HELP opcua_bridge_latency_seconds Message latency per pipeline stage.")
+        lines.append("# TYPE opcua_bridge_latency_seconds histogram")
+        for tag, s in servers:
+            for stage, hist in s.latency.items():
+                labels = f'server="{_label(tag)}",stage="{stage}"'
+                cumulative = 0
+                for bound, n in zip(hist.buckets, hist.counts):
+                    cumulative += n
+                    lines.append(f'opcua_bridge_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'opcua_bridge_latency_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+                lines.append(f"opcua_bridge_latency_seconds_sum{{{labels}}} {hist.sum:.6f}")
+                lines.append(f"opcua_bridge_latency_seconds_count{{{labels}}} {hist.count}")
+
+        if self.mqtt_pool is not None:
+            connections = self.mqtt_pool.stats()
+            metric("opcua_bridge_connection_published_total", "counter", "Messages acknowledged per MQTT connection.",
+                   [({"connection": c["connection"]}, c["published"]) for c in connections])
+            metric("opcua_bridge_connection_errors_total", "counter", "Failed publishes per MQTT connection.",
+                   [({"connection": c["connection"]}, c["errors"]) for c in connections])
+            metric("opcua_bridge_connection_connects_total", "counter", "Successful connects per MQTT connection.",
+                   [({"connection": c["connection"]}, c["connects"]) for c in connections])
+            metric("opcua_bridge_connection_up", "gauge", "1 if the MQTT connection is connected.",
+                   [({"connection": c["connection"]}, int(c["connected"])) for c in connections])
+            metric("opcua_bridge_connection_queue_depth", "gauge", "Messages waiting for an MQTT connection.",
+                   [({"connection": c["connection"]}, c["queue"]["depth"]) for c in connections])
+            metric("opcua_bridge_connection_queue_dropped_total", "counter", "Messages dropped by a connection queue.",
+                   [({"connection": c["connection"]}, c["queue"]["dropped"]) for c in connections])
+
+        metric("opcua_bridge_event_loop_lag_seconds", "gauge", "Last measured event loop lag.",
+               [(None, f"{self.loop_lag:.6f}")])
+        metric("opcua_bridge_event_loop_lag_max_seconds", "gauge", "Largest event loop lag seen.",
+               [(None, f"{self.loop_lag_max:.6f}")])
+        return "\n".join(lines) + "\n"
+
+
+    # {server_tag: {stage: {"count", "mean_ms", "p50_ms", "p90_ms", "p99_ms"}}}
+    def latency_stats(self, server_tag=None):
+        tags = [server_tag] if server_tag is not None else sorted(self.servers)
+        return {
+            tag: {stage: hist.summary() for stage, hist in self.servers[tag].latency.items()}
+            for tag in tags if tag in self.servers
+        }
+
+
+metrics = BridgeMetrics()
+
+
+# 브로커 ACK를 받은 메시지의 구간별 지연을 기록 (server_tag가 없는 메시지는 무시)
+def record_latency(message, acked):
+    server_tag = getattr(message, "server_tag", None)
+    if server_tag is None or message.dequeued is None:
+        return
+    latency = metrics.server(server_tag).latency
+    latency["broker"].observe(acked - message.dequeued)
+    if message.enqueued is not None:
+        latency["queue"].observe(message.dequeued - message.enqueued)
+        latency["encode"].observe(message.enqueued - message.received)
+    if message.source_time is not None:
+        latency["end_to_end"].observe(acked - message.source_time)
+        latency["opcua"].observe(message.received - message.source_time)
+
+
+# 이벤트 루프 지연: interval만큼 잠들었다가 실제로 얼마나 늦게 깨어났는지
+async def measure_loop_lag(interval=0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        metrics.loop_lag = lag
+        if lag > metrics.loop_lag_max:
+            metrics.loop_lag_max = lag
+
+
+async def handle_metrics_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request = await reader.readline()
+        # 나머지 헤더는 읽고 버림
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request.split()
+        path = parts[1] if len(parts) > 1 else b"/"
+        if path in (b"/", b"/metrics"):
+            status = "200 OK"
+            body = metrics.render().encode()
+        else:
+            status = "404 Not Found"
+            body = b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(host, port):
+    server = await asyncio.start_server(handle_metrics_request, host, port)
+    print(f"[metrics] serving on http://{host}:{port}/metrics")
+    async with server:
+        await asyncio.gather(server.serve_forever(), measure_loop_lag())
@@ -9,7 +9,11 @@ from qasync import QEventLoop, asyncSlot
 
 from opcua_client_mqtt_publisher import main as start_opcua_and_mqtt_clients
 from serial_handler import start_serial_backend
-from shared_queue import send_queue
+from shared_queue import send_queue, gui_queue_maxsize, gui_queue_policy
+
+# send_queue 버스에서 GUI만 따로 받는 queue (MQTT 퍼블리셔와 메시지를 나눠 갖지 않음)
+# GUI가 밀리면 이 queue의 오래된 메시지만 버려지고 MQTT 발행에는 영향 없음 (gui_queue.dropped)
+gui_queue = send_queue.subscribe("gui", gui_queue_maxsize, gui_queue_policy)
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -90,8 +94,8 @@ class MainWindow(QMainWindow):
 
 async def gui_loop(window: MainWindow):
     while True:
-        if not send_queue.empty():
-            msg = await send_queue.get()
+        if not gui_queue.empty():
+            msg = await gui_queue.get()
             # msg 객체에 .channel, .topic, .payload, .server_tag 필드가 들어온다고 가정
             channel = getattr(msg, "channel", "Unknown")
             server_tag = getattr(msg, "server_tag", "unknown_server")
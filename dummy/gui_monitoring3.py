@@ -13,7 +13,11 @@ from qasync import QEventLoop, asyncSlot
 
 from opcua_client_mqtt_publisher import main as start_opcua_and_mqtt_clients
 from serial_handler import main as start_serial_backend, change_serial_port
-from shared_queue import send_queue
+from shared_queue import send_queue, gui_queue_maxsize, gui_queue_policy
+
+# send_queue 버스에서 GUI만 따로 받는 queue (MQTT 퍼블리셔와 메시지를 나눠 갖지 않음)
+# GUI가 밀리면 이 queue의 오래된 메시지만 버려지고 MQTT 발행에는 영향 없음 (gui_queue.dropped)
+gui_queue = send_queue.subscribe("gui", gui_queue_maxsize, gui_queue_policy)
 
 
 def pretty_json(d):
@@ -239,8 +243,8 @@ class MainWindow(QMainWindow):
 
 async def gui_loop(window: MainWindow):
     while True:
-        if not send_queue.empty():
-            msg = await send_queue.get()
+        if not gui_queue.empty():
+            msg = await gui_queue.get()
             # MQTT 상태 메시지인지 판별
             if hasattr(msg, "type") and msg.type == "mqtt_status":
                 # 상태 표시 라벨 갱신
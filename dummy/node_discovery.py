@@ -0,0 +1,210 @@
+# node_discovery.py
+# browse root 아래의 Variable 노드를 찾아서 nodes_to_subscribe에 더할 목록을 만듦
+# Browse 요청은 노드를 여러 개씩 묶어서(MaxNodesPerBrowse) 몇 개씩 동시에 보내고,
+# 결과는 서버의 NamespaceArray, model-change stamp와 함께 캐시 파일에 저장해서 다음 시작 때는 다시 browse하지 않음
+#
+# server_configs의 "browse" 키 예시:
+# "browse": {
+#     "root": "ns=2;s=Plant",                 # 기본값 i=85 (Objects 폴더)
+#     "include": ["*/Line1/*"],               # browse path(/Plant/Line1/Temp 형식)에 대한 fnmatch 패턴. 없으면 전부
+#     "exclude": ["*/Diagnostics/*"],
+#     "cache": "server_test.nodes.json",      # 캐시 파일. 없으면 시작할 때마다 browse
+#     "settings": {"publishing_class": "slow"} # 찾은 노드에 붙일 노드별 설정 (nodes_to_subscribe dict와 같은 키)
+# }
+import asyncio
+import fnmatch
+import json
+import os
+import time
+
+from asyncua import Client, ua
+
+# Browse 한 번에 넣을 최대 노드 수 (서버의 MaxNodesPerBrowse가 더 작으면 그 값을 따름)
+browse_batch_size = 1000
+# 동시에 보낼 Browse 요청 수
+browse_concurrency = 4
+
+DEFAULT_BROWSE_ROOT = "i=85"
+CACHE_VERSION = 1
+
+_HAS_PROPERTY = ua.NodeId(ua.ObjectIds.HasProperty)
+# Objects 아래의 Server 객체(진단 정보 등 수백 개 변수)는 root로 직접 지정했을 때만 browse
+_SERVER_OBJECT = ua.NodeId(ua.ObjectIds.Server)
+
+
+# 서버의 OperationLimits 값(MaxNodesPerRead 등)과 default 중 작은 값 (읽지 못하거나 0이면 default)
+async def read_operation_limit(client: Client, limit_id, default):
+    try:
+        limit = await client.get_node(limit_id).read_value()
+    except Exception:
+        limit = 0
+    if limit:
+        return min(limit, default)
+    return default
+
+
+# 서버 모델이 바뀌었는지 판단하는 값
+# 네임스페이스마다 NamespaceMetadata(NamespaceVersion, NamespacePublicationDate)를 읽고,
+# 메타데이터가 없는 네임스페이스가 있으면 서버 StartTime도 넣음 (서버가 다시 시작되면 다시 browse)
+async def read_model_stamp(client: Client, namespace_array):
+    stamp = {}
+    try:
+        for metadata in await client.get_node(ua.ObjectIds.Server_Namespaces).get_children():
+            values = {}
+            for prop in await metadata.get_properties():
+                name = (await prop.read_browse_name()).Name
+                if name in ("NamespaceUri", "NamespaceVersion", "NamespacePublicationDate"):
+                    values[name] = str(await prop.read_value())
+            if "NamespaceUri" in values:
+                stamp[values["NamespaceUri"]] = [
+                    values.get("NamespaceVersion"), values.get("NamespacePublicationDate")
+                ]
+    except ua.UaError:
+        pass
+    if any(uri not in stamp for uri in namespace_array[1:]):
+        start_time = await client.get_node(ua.ObjectIds.Server_ServerStatus_StartTime).read_value()
+        stamp["StartTime"] = str(start_time)
+    return stamp
+
+
+# nodeid 여러 개를 한 번의 Browse(+ 필요하면 BrowseNext)로 처리해서 노드별 reference 목록을 돌려줌
+async def browse_batch(client: Client, nodeids, semaphore):
+    params = ua.BrowseParameters()
+    params.RequestedMaxReferencesPerNode = 0
+    for nodeid in nodeids:
+        description = ua.BrowseDescription()
+        description.NodeId = nodeid
+        description.BrowseDirection = ua.BrowseDirection.Forward
+        description.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HierarchicalReferences)
+        description.IncludeSubtypes = True
+        description.NodeClassMask = ua.NodeClass.Object | ua.NodeClass.Variable
+        description.ResultMask = ua.BrowseResultMask.All
+        params.NodesToBrowse.append(description)
+
+    async with semaphore:
+        results = await client.uaclient.browse(params)
+        references = [list(result.References or []) for result in results]
+        continuation = [(i, r.ContinuationPoint) for i, r in enumerate(results) if r.ContinuationPoint]
+        while continuation:
+            next_params = ua.BrowseNextParameters()
+            next_params.ReleaseContinuationPoints = False
+            next_params.ContinuationPoints = [point for _, point in continuation]
+            next_results = await client.uaclient.browse_next(next_params)
+            remaining = []
+            for (i, _), result in zip(continuation, next_results):
+                references[i].extend(result.References or [])
+                if result.ContinuationPoint:
+                    remaining.append((i, result.ContinuationPoint))
+            continuation = remaining
+    return references
+
+
+# root 아래를 너비 우선으로 한 단계씩 browse해서 [(nodeid 문자열, browse path)]를 돌려줌
+# Variable의 Property(HasProperty)는 구독 대상이 아니므로 건너뜀
+async def browse_variables(client: Client, root, batch_size, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    root = ua.NodeId.from_string(root)
+    visited = {root}
+    found = []
+    level = [(root, "")]
+    while level:
+        batches = [level[i:i + batch_size] for i in range(0, len(level), batch_size)]
+        results = await asyncio.gather(*(
+            browse_batch(client, [nodeid for nodeid, _ in batch], semaphore) for batch in batches
+        ))
+        next_level = []
+        for batch, batch_references in zip(batches, results):
+            for (_, path), references in zip(batch, batch_references):
+                for ref in references:
+                    if ref.ReferenceTypeId == _HAS_PROPERTY or getattr(ref.NodeId, "ServerIndex", 0):
+                        continue
+                    nodeid = ua.NodeId(ref.NodeId.Identifier, ref.NodeId.NamespaceIndex, ref.NodeId.NodeIdType)
+                    if nodeid in visited or nodeid == _SERVER_OBJECT:
+                        continue
+                    visited.add(nodeid)
+                    child_path = f"{path}/{ref.BrowseName.Name}"
+                    if ref.NodeClass == ua.NodeClass.Variable:
+                        found.append((nodeid.to_string(), child_path))
+                    next_level.append((nodeid, child_path))
+        level = next_level
+    return found
+
+
+def match_path(path, include, exclude):
+    if include and not any(fnmatch.fnmatchcase(path, pattern) for pattern in include):
+        return False
+    return not any(fnmatch.fnmatchcase(path, pattern) for pattern in exclude)
+
+
+def load_cache(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# 쓰다가 죽어도 기존 캐시가 깨지지 않도록 임시 파일에 쓴 뒤 교체
+def save_cache(path, cache):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, path)
+
+
+def make_node_entries(nodeids, settings):
+    if not settings:
+        return list(nodeids)
+    return [dict(settings, nodeid=nodeid) for nodeid in nodeids]
+
+
+async def discover_nodes(client: Client, server_tag, browse):
+    """
+    Returns the nodes_to_subscribe entries for every Variable under browse["root"]
+    that matches the include/exclude patterns. Uses the cache file when the query,
+    the namespace array and the model stamp are unchanged; otherwise browses and
+    rewrites the cache.
+    """
+    query = {
+        "root": browse.get("root", DEFAULT_BROWSE_ROOT),
+        "include": list(browse.get("include") or []),
+        "exclude": list(browse.get("exclude") or []),
+    }
+    cache_path = browse.get("cache")
+    namespace_array = await client.get_namespace_array()
+    stamp = await read_model_stamp(client, namespace_array)
+
+    if cache_path:
+        cache = load_cache(cache_path)
+        if (
+            cache is not None
+            and cache.get("version") == CACHE_VERSION
+            and cache.get("query") == query
+            and cache.get("namespace_array") == namespace_array
+            and cache.get("model_stamp") == stamp
+        ):
+            nodeids = [nodeid for nodeid, _ in cache["nodes"]]
+            print(f"[{server_tag}] address space unchanged, {len(nodeids)} nodes from {cache_path}")
+            return make_node_entries(nodeids, browse.get("settings"))
+
+    t_start = time.perf_counter()
+    batch_size = await read_operation_limit(
+        client, ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxNodesPerBrowse, browse_batch_size
+    )
+    found = await browse_variables(client, query["root"], batch_size, browse_concurrency)
+    nodes = [(nodeid, path) for nodeid, path in found if match_path(path, query["include"], query["exclude"])]
+    print(
+        f"[{server_tag}] browsed {len(found)} variables under {query['root']}, "
+        f"{len(nodes)} selected in {time.perf_counter() - t_start:.1f} s"
+    )
+    if cache_path:
+        save_cache(cache_path, {
+            "version": CACHE_VERSION,
+            "query": query,
+            "namespace_array": namespace_array,
+            "model_stamp": stamp,
+            "nodes": nodes,
+        })
+    return make_node_entries([nodeid for nodeid, _ in nodes], browse.get("settings"))
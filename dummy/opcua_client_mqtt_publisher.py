@@ -1,7 +1,13 @@
 from sys import platform
 from os import name
+import argparse
 import asyncio
 import json
+import math
+import os
+import re
+import time
+import zlib
 #from asyncio_mqtt import Client as MqttClient, MqttError
 from aiomqtt import Client as MqttClient, MqttError
 from typing import Dict
@@ -9,10 +15,20 @@ from contextlib import AsyncExitStack
 from asyncua import Client, ua, Node
 from asyncua.common.events import Event
 from asyncua.common.subscription import DataChangeNotif
+from asyncua.common.ua_utils import data_type_to_variant_type
+from asyncua.client.ua_client import UaClientState
 from datetime import timezone
 from datetime import datetime
 
-from shared_queue import send_queue, MQTTStatusMessage
+from shared_queue import (
+    send_queue, send_queue_maxsize, send_queue_policy, BoundedSendQueue, OVERFLOW_BLOCK, MQTTStatusMessage,
+    PRIORITY_ALARM, PRIORITY_HIGH, PRIORITY_BULK, PRIORITY_NAMES
+)
+from payload_codec import get_payload_codec, epochSeconds, CODEC_JSON, ARRAY_ENCODING_STRING
+from bridge_config import load_bridge_config
+from spool import MessageSpool
+from node_discovery import discover_nodes, read_operation_limit
+from bridge_metrics import metrics, publish_stats, record_latency, serve_metrics
 
 ####################################################################################
 # Globals:
@@ -52,6 +68,112 @@ server_configs = [
 broker_ip = "broker.hivemq.com"
 #MQTT 브로커 포트 (기본은 1883, 보안 미적용 시)
 broker_port = 1883
+#퍼블리시 방식. "sequential" → 메시지마다 ACK를 기다림, "pipelined" → 큐를 한 번에 비우고 여러 개를 동시에 전송
+publish_mode = "pipelined"
+#pipelined 모드에서 동시에 ACK를 기다릴 수 있는 QoS1 메시지 최대 개수
+publish_window = 100
+#pipelined 모드에서 큐에서 한 번에 꺼낼 최대 메시지 수
+publish_batch_size = 1000
+# MQTT 연결 수. 2 이상이면 topic 해시로 연결을 고름 (같은 topic은 항상 같은 연결이라 topic별 순서는 유지되고,
+# 다른 topic은 여러 소켓으로 동시에 나감). 연결마다 따로 재연결하고, spool_path를 쓰면 연결마다 "{spool_path}.{번호}" 파일 사용
+# (연결 수를 바꿔도 시작할 때 예전 spool 파일에 남은 메시지를 지금 파일로 옮김, adopt_leftover_spools 참고)
+mqtt_connections = 1
+
+# 브로커에 연결되지 않은 동안 send_queue를 디스크(SQLite WAL)에 옮겨 두는 store-and-forward 파일. None이면 사용 안 함
+# 다시 연결되면 저장된 메시지를 순서대로 먼저 보낸 뒤 실시간 메시지를 보냄 (프로세스를 다시 시작해도 유지됨)
+spool_path = None
+# 재연결 후 디스크에 쌓인 메시지를 다시 보내는 속도(msg/s, 0이면 제한 없이 브로커 ACK 속도대로)와 한 번에 읽는 개수
+# 재전송 중에 들어온 실시간 메시지도 순서를 지키려고 디스크 뒤에 붙이므로, 제한을 두면 들어오는 속도보다 커야 재전송이 끝남
+spool_replay_rate = 0
+spool_batch_size = 500
+# 브로커에 연결되지 않은 동안(연결 시도 중 포함) queue를 디스크로 옮기는 주기(초)
+spool_drain_interval = 0.1
+
+# 같은 topic의 datachange를 모아서 마지막 값만 보내는 주기(초). 0이면 사용 안 함
+# 서버별로 server_configs의 "coalesce_window" 키로 덮어쓸 수 있음
+coalesce_window = 0
+
+# 노드별 설정 기본값: (sampling_interval, queuesize, deadband_type, deadband_value)
+DEFAULT_NODE_SETTINGS = (None, 100, None, None)
+# sampling_interval을 지정하지 않은 노드의 sampling interval(ms). deadband 필터 유무와 관계없이 같은 값
+DEFAULT_SAMPLING_INTERVAL = 50.0
+DEADBAND_TYPES = {
+    "absolute": ua.DeadbandType.Absolute,
+    "percent": ua.DeadbandType.Percent,
+}
+
+# 구독 클래스별 publishing interval(ms). 노드별 설정 "publishing_class"로 선택하고, 클래스마다 subscription을 하나씩 만듦
+publishing_intervals = {
+    "fast": 250,
+    "normal": 2000,
+    "slow": 10000,
+}
+# publishing_class를 지정하지 않은 노드와 이벤트가 들어가는 클래스
+default_publishing_class = "normal"
+# CreateMonitoredItems 한 번에 보낼 최대 노드 수 (서버의 MaxMonitoredItemsPerCall이 더 작으면 그 값을 따름)
+monitored_items_per_call = 1000
+
+# 값 수집 방식: "subscription"(기본, monitored item) 또는 "polling"(Read 서비스로 주기적으로 읽음)
+# subscription을 잘 처리하지 못하는 서버용. 서버별로 server_configs의 "acquisition" 키로 덮어쓸 수 있음
+ACQUISITION_SUBSCRIPTION = "subscription"
+ACQUISITION_POLLING = "polling"
+default_acquisition = ACQUISITION_SUBSCRIPTION
+# polling 모드의 scan 주기(ms). 서버별로 "poll_interval" 키로 덮어쓸 수 있음
+poll_interval = 1000
+# Read 한 번에 넣을 최대 노드 수 (서버의 MaxNodesPerRead가 더 작으면 그 값을 따름)
+read_nodes_per_call = 1000
+
+# MQTT → OPC UA 쓰기: demo/opcua-sub-to-mqtt/{server_tag}/write/{nodeid} 토픽으로 받은 값을 서버에 씀
+# 브로커에 접속할 수 있으면 누구나 쓸 수 있으므로 서버별로 server_configs의 "write_enabled" 키로 켜야 함
+# payload: JSON 값 하나(예: 12.5) 또는 {"Value": 12.5, "VariantType": "Double", "RequestId": "abc"}
+#          VariantType을 생략하면 노드의 DataType으로 정함 (노드별로 한 번만 읽음)
+# 결과는 demo/opcua-sub-to-mqtt/{server_tag}/write-response 토픽에 {"Results": [{"NodeId", "RequestId", "Status"}, ...]}로 보냄
+default_write_enabled = False
+# 이 시간(초) 안에 들어온 쓰기 요청을 모아서 서버마다 Write 한 번으로 보냄 (같은 노드는 마지막 값만 씀)
+write_window = 0.05
+# Write 한 번에 넣을 최대 노드 수 (서버의 MaxNodesPerWrite가 더 작으면 그 값을 따름)
+write_nodes_per_call = 1000
+# server_tag → OpcUaWriter (opcua_client가 등록하고 publisher가 받은 요청을 넘겨줌)
+write_targets = {}
+
+# 연결이 잠깐 끊겼을 때 subscription을 지우지 않고 세션 재활성화 + TransferSubscriptions/Republish로 살리는 방식
+# (asyncua Client의 auto_reconnect 기능 사용). resume_timeout(초) 안에 살리지 못하면 기존처럼 처음부터 다시 구독
+fast_reconnect = True
+resume_timeout = 30.0
+# 접속 재시도 대기 시간(초): 실패할 때마다 2배씩 늘어남
+reconnect_delay_min = 0.5
+reconnect_delay_max = 10.0
+
+# 연결 감시: ServiceLevel을 주기적으로 읽는 대신 subscription의 publish 응답/keepalive 시각과
+# status_change_notification으로 끊김을 판단함 (추가 Read 없음)
+# 데이터가 없어도 서버가 keepalive를 보내는 간격(초). subscription마다 MaxKeepAliveCount를 여기에 맞춤
+keepalive_interval = 5.0
+# 마지막 publish 응답 후 keepalive 간격의 몇 배가 지나면 끊긴 것으로 볼지
+keepalive_margin = 1.25
+# case 3에서 위 조건을 확인하는 주기(초, 네트워크 요청 없음)
+watchdog_interval = 0.5
+# ServiceLevel(ns=0;i=2267) 확인 주기(초). 느린 보조 점검용, 0이면 읽지 않음
+service_level_interval = 30.0
+# asyncua Client 자체의 server_state 확인 주기(초). 빠른 감지는 keepalive 감시가 하므로 길게 둠
+client_probe_interval = 60.0
+
+# Prometheus 형식 metrics를 보여줄 로컬 HTTP 주소 (http://127.0.0.1:9108/metrics). None이면 사용 안 함
+metrics_host = "127.0.0.1"
+metrics_port = None
+# 서버별 지연 시간 요약(p50/p90/p99)을 demo/opcua-sub-to-mqtt/{server_tag}/latency 토픽에 보내는 주기(초). 0이면 사용 안 함
+latency_summary_interval = 0
+
+# MQTT payload 형식: "json"(기존 문자열 JSON), "msgpack", "cbor"
+# 서버별로 server_configs의 "payload_codec" 키로 덮어쓸 수 있음
+# 선택한 형식은 demo/opcua-sub-to-mqtt/{server_tag}/content-type 토픽에 retain으로 알림
+default_payload_codec = CODEC_JSON
+# 숫자 배열 값 인코딩: "string"(기존 str(list)), "ndarray"(dtype/shape + little-endian 바이트, JSON은 base64)
+# 서버별로 server_configs의 "array_encoding" 키로 덮어쓸 수 있음
+default_array_encoding = ARRAY_ENCODING_STRING
+# 숫자 배열을 바뀐 index 구간만 보내는 delta 모드의 keyframe(전체 배열) 주기(초). 0이면 사용 안 함
+# 켜면 배열은 ndarray 블록/ndarray-delta 블록으로 보내고, 바뀐 원소가 없는 알림은 보내지 않음
+# 서버별로 server_configs의 "array_delta" 키로 덮어쓸 수 있음
+default_array_delta = 0
 
 class MQTTStatusMessage:
     def __init__(self, status, broker, port, topics, detail=""):
@@ -139,50 +261,167 @@ def makeJsonStringFromDict(d):
 ####################################################################################
 # OpcUaClient:
 ####################################################################################
+# 같은 topic으로 짧은 시간 안에 여러 번 들어온 datachange를 모아서 마지막 값 하나만 send_queue에 넣음
+class TopicCoalescer:
+    """
+    Collapses bursts of data changes per topic into one message holding the newest value.
+    Flushes every `window` seconds; distinct topics keep the order of their first arrival.
+    Values are encoded at flush time, so values that get replaced are never encoded and
+    an array delta always applies to the array that was actually sent before.
+    """
+
+    def __init__(self, window, queue=send_queue):
+        self.window = window
+        self.queue = queue
+        self.pending = {}
+        self.received = 0
+        self.coalesced = 0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    # handler.make_message(info, dv, received)로 내보낼 때 MqttMessage를 만듦
+    def put(self, handler, info, dv, received):
+        self.received += 1
+        if info.topic in self.pending:
+            self.coalesced += 1
+        # 이미 있는 key에 대입하면 dict 안의 순서는 처음 들어온 위치 그대로 유지됨
+        self.pending[info.topic] = (handler, info, dv, received)
+
+    async def flush(self):
+        batch, self.pending = self.pending, {}
+        now = time.time()
+        for handler, info, dv, received in batch.values():
+            msg = handler.make_message(info, dv, received)
+            if msg is None:
+                continue
+            msg.enqueued = now
+            await self.queue.put(msg)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.window)
+            await self.flush()
+
+# 노드별로 바뀌지 않는 정보 (구독할 때 한 번만 만들어 둠)
+class NodeInfo:
+    def __init__(self, topic, nodeid, priority=PRIORITY_BULK):
+        self.topic = topic
+        self.nodeid = nodeid
+        self.priority = priority
+
 # OPCUA SERVER에서 전달받은 이벤트나 datachange를 처리하는 콜백 핸들러
 class SubscriptionHandler:
     """
     The SubscriptionHandler is used to handle the data that is received for the subscription.
     """
 
-    def __init__(self, server_tag):
+    def __init__(self, server_tag, coalescer=None, codec=None, priorities=None):
         self.server_tag = server_tag
-        
+        # nodeid 문자열 → 우선순위 (bulk가 아닌 노드만). 없는 노드는 PRIORITY_BULK
+        self.priorities = priorities if priorities is not None else {}
+        # coalescer가 있으면 datachange는 coalescer를 거쳐 send_queue로 감 (이벤트는 항상 바로 send_queue로)
+        self.coalescer = coalescer
+        # payload 코덱 (기본은 makeDictFromDataValue → json.dumps와 같은 결과를 더 빠르게 만드는 JSON 코덱)
+        self.codec = codec if codec is not None else get_payload_codec(CODEC_JSON)
+        # monitored item의 client handle → NodeInfo (topic 등)
+        self.node_table = {}
+        # 서버가 보낸 마지막 Bad StatusChangeNotification (연결 감시에 사용, 정상이면 None)
+        self.bad_status = None
+        self.stats = metrics.server(server_tag)
+
+    def add_node_info(self, client_handle, node: Node):
+        nodeid = node.nodeid.to_string()
+        info = NodeInfo(
+            topic=f"demo/opcua-sub-to-mqtt/{self.server_tag}/variables/{nodeid}",
+            nodeid=nodeid,
+            priority=self.priorities.get(nodeid, PRIORITY_BULK)
+        )
+        self.node_table[client_handle] = info
+        return info
+
+    # subscribe_data_change 직후에 호출: subscription의 monitored item들로 테이블을 새로 만듦
+    # (재연결 후 case 2에서 다시 구독하면 client handle이 바뀔 수 있으므로 매번 다시 만들어야 함)
+    def build_node_table(self, subscription):
+        self.node_table = {}
+        for client_handle, item in subscription._monitored_items.items():
+            if item.attribute == ua.AttributeIds.Value:
+                self.add_node_info(client_handle, item.node)
+
     # 서버의 노드 값이 바뀌면 호출됨
     async def datachange_notification(self, node: Node, val, data: DataChangeNotif):
         """
         Callback for asyncua Subscription.
         This method will be called when the Client received a data change message from the Server.
         """
-        # 받은 값을 JSON 문자열로 변환하고,
+        received = time.time()
+        self.stats.notifications += 1
+        client_handle = data.monitored_item.ClientHandle
+        info = self.node_table.get(client_handle)
+        if info is None:
+            # 테이블을 만들기 전에 첫 알림이 먼저 도착한 경우
+            info = self.add_node_info(client_handle, node)
+        await self.put_datavalue(info, data.monitored_item.Value, received)
+
+    # 값 하나를 send_queue(또는 coalescer)에 넣음 (polling 모드도 같은 경로 사용)
+    async def put_datavalue(self, info: NodeInfo, dv: ua.DataValue, received):
+        if self.coalescer is not None:
+            # 인코딩은 coalescer가 내보낼 때 함 (array delta의 기준 배열이 실제로 보낸 값이 되도록)
+            self.coalescer.put(self, info, dv, received)
+            return
+        msg = self.make_message(info, dv, received)
+        if msg is None:
+            return
+        # send_queue에 MqttMessage 형태로 담아 큐에 저장한다. 나중에 MQTT 퍼블리셔가 이 메시지를 브로커에 발행함.
+        msg.enqueued = time.time()
+        await send_queue.put(msg)
+
+    # 받은 값을 payload로 변환해서 MqttMessage로 만듦. array delta 모드에서 배열 값이 그대로면 None
+    def make_message(self, info: NodeInfo, dv: ua.DataValue, received):
+        # 코덱의 노드별 상태는 nodeid로 구분 (client handle은 subscription마다 201부터 시작해서 겹침)
+        payload = self.codec.encode_datavalue(info.nodeid, dv)
+        if payload is None:
+            return None
+        # delta는 이전 값이 있어야 의미가 있으므로 retain하지 않음 (retain된 메시지는 마지막 keyframe으로 남음)
+        delta = self.codec.delta
         msg = MqttMessage(
-            topic=f"demo/opcua-sub-to-mqtt/{self.server_tag}/variables/{node.nodeid.to_string()}",
-            payload=makeJsonStringFromDict(
-                makeDictFromDataValue(
-                    data.monitored_item.Value
-                )
-            ),
+            topic=info.topic,
+            payload=payload,
             qos=1,
-            retain=True
+            retain=delta is None or not delta.last_was_delta(info.nodeid),
+            priority=info.priority,
+            server_tag=self.server_tag,
+            source_time=epochSeconds(dv.SourceTimestamp) if dv.SourceTimestamp else None,
+            received=received
         )
-        # send_queue에 MqttMessage 형태로 담아 큐에 저장한다. 나중에 MQTT 퍼블리셔가 이 메시지를 브로커에 발행함.
-        await send_queue.put(msg)
+        if delta is not None and delta.tracks(info.nodeid):
+            msg.delta = (delta, info.nodeid)
+        return msg
 
     # 이벤트 발생 시 호출되어 이벤트 데이터를 마찬가지로 JSON으로 만들어 send_queue에 넣음
     async def event_notification(self, event: Event):
         """
         called for every event notification from server
         """
+        received = time.time()
+        self.stats.events += 1
         fields = event.get_event_props_as_fields_dict()
+        if self.codec.name == CODEC_JSON:
+            payload = makeJsonStringFromDict(makeDictFromEventData(fields))
+        else:
+            payload = self.codec.encode_event(fields)
         msg = MqttMessage(
             topic=f"demo/opcua-sub-to-mqtt/events/{str(event.SourceName).lower()}",
-            payload=makeJsonStringFromDict(
-                makeDictFromEventData(
-                    fields
-                )
-            ),
-            qos=1
+            payload=payload,
+            qos=1,
+            retain=True,
+            priority=PRIORITY_ALARM,
+            server_tag=self.server_tag,
+            source_time=epochSeconds(event.Time) if getattr(event, "Time", None) else None,
+            received=received
         )
+        msg.enqueued = time.time()
         await send_queue.put(msg)
 
     # 서버 연결 상태가 바뀌었을 때 호출됨 (로그 용도로)
@@ -191,66 +430,556 @@ class SubscriptionHandler:
         called for every status change notification from server
         """
         print("StatusChangeNotification: ", status)
-        pass
+        if not status.Status.is_good():
+            self.bad_status = status.Status
+
+# polling에서 이전 값과 같은지 비교 (NaN → NaN은 같은 값으로 봄, 배열은 원소별로)
+def isSameValue(a, b):
+    if a == b:
+        return True
+    if type(a) is float and type(b) is float:
+        return a != a and b != b
+    if type(a) is list and type(b) is list:
+        return len(a) == len(b) and all(map(isSameValue, a, b))
+    return False
+
+# subscription 대신 설정된 노드를 Read 서비스로 주기적으로 읽음 (Read 한 번에 최대 chunk_size개)
+# 이전 scan과 값 또는 StatusCode가 다른 노드만 SubscriptionHandler와 같은 경로로 send_queue에 넣음
+class NodePoller(SubscriptionHandler):
+    """
+    Polls the configured nodes with batched Read service calls instead of a subscription.
+    A node is published when its value or status differs from the previous scan;
+    the first scan after (re)connecting publishes every node, like a new subscription.
+    """
+
+    def __init__(self, server_tag, coalescer=None, codec=None, priorities=None):
+        super().__init__(server_tag, coalescer, codec, priorities)
+        self.chunk_size = read_nodes_per_call
+        # node_table의 key(0, 1, 2, ...) 순서대로 ReadValueId와 마지막 (값, status code)
+        self.read_ids = []
+        self.last = []
+        self.scans = 0
+        self.overruns = 0
+
+    def set_nodes(self, nodes):
+        self.node_table = {}
+        self.read_ids = []
+        for key, node in enumerate(nodes):
+            self.add_node_info(key, node)
+            read_id = ua.ReadValueId()
+            read_id.NodeId = node.nodeid
+            read_id.AttributeId = ua.AttributeIds.Value
+            self.read_ids.append(read_id)
+        self.last = [None] * len(self.read_ids)
+
+    async def scan(self, client: Client):
+        changed = 0
+        for start in range(0, len(self.read_ids), self.chunk_size):
+            params = ua.ReadParameters()
+            params.NodesToRead = self.read_ids[start:start + self.chunk_size]
+            params.TimestampsToReturn = ua.TimestampsToReturn.Both
+            values = await client.uaclient.read(params)
+            received = time.time()
+            for key, dv in enumerate(values, start):
+                current = (dv.Value.Value if dv.Value is not None else None, dv.StatusCode.value)
+                last = self.last[key]
+                if last is not None and current[1] == last[1] and isSameValue(current[0], last[0]):
+                    continue
+                self.last[key] = current
+                changed += 1
+                await self.put_datavalue(self.node_table[key], dv, received)
+        self.stats.notifications += changed
+        self.scans += 1
+        return changed
+
+# 쓰기 요청 JSON 값 → VariantType에 맞는 Python 값 (정수 타입에 12.5 같은 값이 오면 ValueError)
+_INTEGER_VARIANT_TYPES = {
+    ua.VariantType.SByte, ua.VariantType.Byte, ua.VariantType.Int16, ua.VariantType.UInt16,
+    ua.VariantType.Int32, ua.VariantType.UInt32, ua.VariantType.Int64, ua.VariantType.UInt64,
+}
+
+def _toInteger(x):
+    if isinstance(x, bool) or (isinstance(x, float) and not x.is_integer()):
+        raise ValueError(f"{x!r} is not an integer")
+    return int(x)
+
+def _toBoolean(x):
+    if not isinstance(x, (bool, int)):
+        raise ValueError(f"{x!r} is not a boolean")
+    return bool(x)
+
+def makeWriteVariant(value, vt: ua.VariantType):
+    if vt in _INTEGER_VARIANT_TYPES:
+        convert = _toInteger
+    elif vt in (ua.VariantType.Float, ua.VariantType.Double):
+        convert = float
+    elif vt == ua.VariantType.Boolean:
+        convert = _toBoolean
+    elif vt == ua.VariantType.DateTime:
+        convert = datetime.fromisoformat
+    elif vt == ua.VariantType.String:
+        convert = str
+    else:
+        raise ValueError(f"writing {vt.name} values is not supported")
+    if isinstance(value, list):
+        return ua.Variant([convert(x) for x in value], vt)
+    return ua.Variant(convert(value), vt)
+
+# MQTT로 받은 쓰기 요청을 서버별로 모아서 batched Write로 보냄
+class OpcUaWriter:
+    """
+    Collects MQTT write requests for one server and writes them every `window` seconds
+    with one Write service call (chunked to MaxNodesPerWrite). Requests for the same
+    node within a window are checked in order and only the newest valid value is
+    written; every request gets its own result on
+    demo/opcua-sub-to-mqtt/{server_tag}/write-response (a valid request that a newer
+    one replaced gets GoodDataIgnored). Retained write commands, which the broker
+    delivers again on every (re)subscribe, are never written: they get BadRequestNotAllowed.
+    """
+
+    def __init__(self, server_tag, window):
+        self.server_tag = server_tag
+        self.window = window
+        # opcua_client가 case 3(구독/polling 중)일 때만 Client를 넣어 둠. None이면 BadServerNotConnected로 응답
+        self.client = None
+        self.chunk_size = write_nodes_per_call
+        self.read_chunk_size = read_nodes_per_call
+        # nodeid 문자열 → [(값, VariantType 또는 None, RequestId), ...] 들어온 순서 (dict 순서 = 노드가 처음 들어온 순서)
+        self.pending = {}
+        # 받자마자 거절한 요청의 결과 (다음 응답에 같이 보냄)
+        self.rejected = []
+        # nodeid 문자열 → DataType으로 정한 VariantType
+        self.variant_types = {}
+        self.wakeup = asyncio.Event()
+        self.requests = 0
+        self.batches = 0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def connected(self, client: Client):
+        self.chunk_size = await read_operation_limit(
+            client, ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxNodesPerWrite, write_nodes_per_call
+        )
+        self.read_chunk_size = await read_nodes_per_read_size(client)
+        self.client = client
+
+    # retained: 브로커가 보관하던 retain 메시지 (구독할 때마다 다시 옴) → 쓰지 않고 BadRequestNotAllowed로 응답
+    def put(self, nodeid, payload, retained=False):
+        self.requests += 1
+        self.wakeup.set()
+        request_id = None
+        try:
+            request = json.loads(payload)
+            if isinstance(request, dict) and "Value" in request:
+                value = request["Value"]
+                request_id = request.get("RequestId")
+                vt = request.get("VariantType")
+                if vt is not None:
+                    vt = ua.VariantType[vt] if isinstance(vt, str) else ua.VariantType(vt)
+            else:
+                value, vt = request, None
+            ua.NodeId.from_string(nodeid)
+        except ua.UaStringParsingError:
+            self.rejected.append(makeWriteResult(nodeid, request_id, ua.StatusCodes.BadNodeIdInvalid))
+            return
+        except (ValueError, KeyError):
+            self.rejected.append(makeWriteResult(nodeid, request_id, ua.StatusCodes.BadDecodingError))
+            return
+        if retained:
+            self.rejected.append(makeWriteResult(nodeid, request_id, ua.StatusCodes.BadRequestNotAllowed))
+            return
+        self.pending.setdefault(nodeid, []).append((value, vt, request_id))
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(self.window)
+            self.wakeup.clear()
+            batch, self.pending = self.pending, {}
+            results, self.rejected = self.rejected, []
+            results.extend(await self.write_batch(batch))
+            await send_queue.put(MqttMessage(
+                topic=f"demo/opcua-sub-to-mqtt/{self.server_tag}/write-response",
+                payload=json.dumps({"Results": results}),
+                qos=1,
+                priority=PRIORITY_HIGH
+            ))
+
+    async def write_batch(self, batch):
+        if not batch:
+            return []
+        client = self.client
+        if client is None:
+            return [
+                makeWriteResult(nodeid, request_id, ua.StatusCodes.BadServerNotConnected)
+                for nodeid, requests in batch.items() for _, _, request_id in requests
+            ]
+        self.batches += 1
+        items = list(batch.items())
+        # 요청마다 status (None이면 아직 결과 없음)와, 노드마다 실제로 쓰는 요청의 위치
+        statuses = [[None] * len(requests) for _, requests in items]
+        written = [None] * len(items)
+        try:
+            unresolved = await self.resolve_variant_types(
+                client, [nodeid for nodeid, requests in items if any(vt is None for _, vt, _ in requests)]
+            )
+            to_write = []
+            for i, (nodeid, requests) in enumerate(items):
+                # 들어온 순서대로 검사해서 마지막으로 유효한 값만 씀 (순서대로 썼을 때와 같은 결과)
+                variant = None
+                for j, (value, vt, _) in enumerate(requests):
+                    vt = vt or self.variant_types.get(nodeid)
+                    if vt is None:
+                        statuses[i][j] = unresolved.get(nodeid, ua.StatusCodes.BadTypeMismatch)
+                        continue
+                    try:
+                        candidate = makeWriteVariant(value, vt)
+                    except (TypeError, ValueError):
+                        statuses[i][j] = ua.StatusCodes.BadTypeMismatch
+                        continue
+                    if variant is not None:
+                        statuses[i][written[i]] = ua.StatusCodes.GoodDataIgnored
+                    variant, written[i] = candidate, j
+                if variant is not None:
+                    to_write.append((i, ua.WriteValue(
+                        NodeId=ua.NodeId.from_string(nodeid),
+                        AttributeId=ua.AttributeIds.Value,
+                        Value=ua.DataValue(variant),
+                    )))
+            for start in range(0, len(to_write), self.chunk_size):
+                chunk = to_write[start:start + self.chunk_size]
+                params = ua.WriteParameters()
+                params.NodesToWrite = [write_value for _, write_value in chunk]
+                for (i, _), status in zip(chunk, await client.uaclient.write(params)):
+                    statuses[i][written[i]] = status.value
+        except Exception as e:
+            print(f"[{self.server_tag}] write error: {e!r}")
+            statuses = [
+                [status if status is not None else ua.StatusCodes.BadCommunicationError for status in node_statuses]
+                for node_statuses in statuses
+            ]
+        return [
+            makeWriteResult(nodeid, request_id, status)
+            for (nodeid, requests), node_statuses in zip(items, statuses)
+            for (_, _, request_id), status in zip(requests, node_statuses)
+        ]
+
+    # VariantType을 모르는 노드의 DataType 속성을 한 번에 읽어서 variant_types에 채움
+    # DataType을 읽지 못한 노드는 {nodeid: status code}로 돌려줌 (예: BadNodeIdUnknown)
+    async def resolve_variant_types(self, client: Client, nodeids):
+        unresolved = {}
+        nodeids = [n for n in nodeids if n not in self.variant_types]
+        for start in range(0, len(nodeids), self.read_chunk_size):
+            chunk = nodeids[start:start + self.read_chunk_size]
+            params = ua.ReadParameters()
+            for nodeid in chunk:
+                read_id = ua.ReadValueId()
+                read_id.NodeId = ua.NodeId.from_string(nodeid)
+                read_id.AttributeId = ua.AttributeIds.DataType
+                params.NodesToRead.append(read_id)
+            for nodeid, dv in zip(chunk, await client.uaclient.read(params)):
+                if not dv.StatusCode.is_good():
+                    unresolved[nodeid] = dv.StatusCode.value
+                    continue
+                datatype = dv.Value.Value
+                # 기본 타입(ns=0;i=1..25)은 VariantType 번호와 같음. 나머지는 상위 타입을 따라가서 찾음
+                if datatype.NamespaceIndex == 0 and isinstance(datatype.Identifier, int) and 1 <= datatype.Identifier <= 25:
+                    self.variant_types[nodeid] = ua.VariantType(datatype.Identifier)
+                else:
+                    self.variant_types[nodeid] = await data_type_to_variant_type(client.get_node(datatype))
+        return unresolved
+
+# 쓰기 요청 하나의 결과
+def makeWriteResult(nodeid, request_id, status_value):
+    return {"NodeId": nodeid, "RequestId": request_id, "Status": makeDictFromStatusCode(ua.StatusCode(status_value))}
+
+# nodes_to_subscribe 항목은 "ns=2;i=2" 같은 NodeId 문자열이거나, 노드별 설정을 담은 dict:
+# {"nodeid": "ns=2;i=2", "sampling_interval": 500, "queuesize": 10,
+#  "deadband_type": "absolute" | "percent", "deadband_value": 0.5,
+#  "publishing_class": "fast" | "normal" | "slow"}
+# 설정을 생략하면 queuesize=100, sampling interval DEFAULT_SAMPLING_INTERVAL(50ms, 필터가 있어도 같음), 필터 없음, publishing interval 2000ms
+def parse_node_entry(entry):
+    if isinstance(entry, str):
+        return entry, default_publishing_class, DEFAULT_NODE_SETTINGS
+    publishing_class = entry.get("publishing_class") or default_publishing_class
+    if publishing_class not in publishing_intervals:
+        raise ValueError(f"{entry['nodeid']}: publishing_class must be one of {list(publishing_intervals)}")
+    sampling_interval = entry.get("sampling_interval")
+    deadband_type = entry.get("deadband_type")
+    deadband_value = entry.get("deadband_value")
+    if deadband_type is not None and deadband_type not in DEADBAND_TYPES:
+        raise ValueError(f"{entry['nodeid']}: deadband_type must be one of {list(DEADBAND_TYPES)}")
+    settings = (
+        float(sampling_interval) if sampling_interval is not None else None,
+        int(entry.get("queuesize", DEFAULT_NODE_SETTINGS[1])),
+        deadband_type if deadband_type and deadband_value else None,
+        float(deadband_value) if deadband_type and deadband_value else None,
+    )
+    return entry["nodeid"], publishing_class, settings
+
+# 서버에서 값 변화를 거르는 deadband 필터 (absolute: 값 차이, percent: EURange 대비 %)
+def makeDataChangeFilter(deadband_type, deadband_value):
+    mfilter = ua.DataChangeFilter()
+    mfilter.Trigger = ua.DataChangeTrigger.StatusValue
+    mfilter.DeadbandType = DEADBAND_TYPES[deadband_type]
+    mfilter.DeadbandValue = deadband_value
+    return mfilter
+
+# subscription 생성 파라미터: keepalive가 keepalive_interval마다 오도록 MaxKeepAliveCount를 정함
+def makeSubscriptionParameters(period):
+    params = ua.CreateSubscriptionParameters()
+    params.RequestedPublishingInterval = period
+    params.RequestedMaxKeepAliveCount = max(1, math.ceil(keepalive_interval * 1000 / period))
+    params.RequestedLifetimeCount = max(10000, params.RequestedMaxKeepAliveCount * 3)
+    params.MaxNotificationsPerPublish = 10000
+    params.PublishingEnabled = True
+    params.Priority = 0
+    return params
+
+# keepalive/publish 응답이 끊겼거나 서버가 Bad status를 보냈으면 그 이유를, 정상이면 None을 돌려줌
+def find_connection_problem(subscriptions, handlers):
+    for handler in handlers.values():
+        if handler.bad_status is not None:
+            return f"status change {handler.bad_status.name}"
+    for subscription, _ in subscriptions:
+        if subscription.is_stale(keepalive_margin):
+            return f"no publish response or keepalive for subscription {subscription.subscription_id}"
+    return None
+
+# 서버가 한 번의 Read 호출에서 받을 수 있는 노드 수 (읽지 못하면 read_nodes_per_call)
+async def read_nodes_per_read_size(client: Client):
+    return await read_operation_limit(
+        client, ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxNodesPerRead, read_nodes_per_call
+    )
+
+# 설정이 같은 노드 묶음을 chunk_size개씩 나눠서 subscription에 등록
+async def subscribe_node_group(server_tag, subscription, nodes, settings, chunk_size):
+    handles = []
+    for i in range(0, len(nodes), chunk_size):
+        handles.extend(await subscribe_node_chunk(subscription, nodes[i:i + chunk_size], settings))
+    # 등록에 실패한 노드는 StatusCode로 돌아오므로 handle 목록에서 뺌
+    failed = [h for h in handles if not isinstance(h, int)]
+    if failed:
+        print(f"[{server_tag}] {len(failed)} monitored item(s) could not be created ({failed[0].name})")
+    return [h for h in handles if isinstance(h, int)]
+
+async def subscribe_node_chunk(subscription, nodes, settings):
+    sampling_interval, queuesize, deadband_type, deadband_value = settings
+    # sampling_interval을 생략하면 deadband가 있든 없든 같은 기본값 (asyncua subscribe_data_change 기본값)
+    if sampling_interval is None:
+        sampling_interval = DEFAULT_SAMPLING_INTERVAL
+    if deadband_type is None:
+        handles = await subscription.subscribe_data_change(
+            nodes=nodes,
+            attr=ua.AttributeIds.Value,
+            queuesize=queuesize,
+            monitoring=ua.MonitoringMode.Reporting,
+            sampling_interval=sampling_interval
+        )
+    else:
+        # subscribe_data_change는 필터를 받지 않으므로 asyncua 내부의 _subscribe를 사용
+        # (_subscribe의 기본값 0은 서버가 허용하는 가장 빠른 주기라서 항상 sampling_interval을 넘김)
+        handles = await subscription._subscribe(
+            nodes,
+            ua.AttributeIds.Value,
+            makeDataChangeFilter(deadband_type, deadband_value),
+            queuesize,
+            ua.MonitoringMode.Reporting,
+            sampling_interval
+        )
+    return handles if isinstance(handles, list) else [handles]
 
 # OPC UA 서버와 통신하며 상태 관리 및 재연결 수행
-async def opcua_client(server_tag, server_url, nodes_to_subscribe, events_to_subscribe):
+# publishing class별로 subscription을 나누고, 그 안에서 같은 설정(sampling interval, queue size, deadband)을
+# 가진 노드끼리 묶어서 한 번에 구독: {publishing_class: {settings: [Node, ...]}}
+# priorities dict를 넘기면 노드별 "priority" 설정(alarm/high)도 채움
+def group_nodes(client: Client, nodes_to_subscribe, events_to_subscribe, priorities=None):
+    node_groups = {}
+    if nodes_to_subscribe:
+        for entry in nodes_to_subscribe:
+            nodeid, publishing_class, settings = parse_node_entry(entry)
+            node = client.get_node(nodeid)
+            node_groups.setdefault(publishing_class, {}).setdefault(settings, []).append(node)
+            if priorities is not None and isinstance(entry, dict) and entry.get("priority"):
+                priority = PRIORITY_NAMES.get(entry["priority"])
+                if priority is None:
+                    raise ValueError(f"{nodeid}: priority must be one of {list(PRIORITY_NAMES)}")
+                if priority != PRIORITY_BULK:
+                    priorities[node.nodeid.to_string()] = priority
+    if events_to_subscribe:
+        node_groups.setdefault(default_publishing_class, {})
+    return node_groups
+
+async def opcua_client(server_tag, server_url, nodes_to_subscribe, events_to_subscribe, coalesce_window=0,
+                       payload_codec=CODEC_JSON, browse=None, array_encoding=ARRAY_ENCODING_STRING, array_delta=0,
+                       acquisition=ACQUISITION_SUBSCRIPTION, scan_interval=None, write_enabled=False):
     """
     Handles connect/disconnect/reconnect/subscribe/unsubscribe
-    and connection-monitoring via cyclic service-level read.
+    and connection-monitoring via subscription keepalives and status changes
+    (plus an optional, slower service-level read). With fast_reconnect, a lost connection first goes to case 5, where the client
+    reactivates the session and transfers the subscriptions; case 4 (full teardown
+    and resubscribe) only runs when that does not succeed within resume_timeout.
+    With acquisition "polling", case 2 prepares a NodePoller and case 3 scans every
+    scan_interval ms (default poll_interval); a failed Read goes to case 4.
+    With write_enabled, MQTT write requests for this server are written while in case 3.
     """
-    client = Client(url=server_url)
-    handler = SubscriptionHandler(server_tag)  # server_tag 전달
-    subscription = None
+    if acquisition not in (ACQUISITION_SUBSCRIPTION, ACQUISITION_POLLING):
+        raise ValueError(f"[{server_tag}] acquisition must be {ACQUISITION_SUBSCRIPTION!r} or {ACQUISITION_POLLING!r}")
+    polling = acquisition == ACQUISITION_POLLING
+    # polling 모드는 옮겨올 subscription이 없으므로 asyncua의 재연결 대신 case 4 → 1로 다시 접속
+    client = Client(url=server_url, watchdog_intervall=client_probe_interval, auto_reconnect=fast_reconnect and not polling)
+    retry_delay = 0
+    next_service_level_check = 0
+    stats = metrics.server(server_tag)
+    coalescer = None
+    if coalesce_window:
+        coalescer = TopicCoalescer(coalesce_window)
+        coalescer.start()
+    codec = get_payload_codec(payload_codec, array_encoding, array_delta)
+    writer = None
+    if write_enabled:
+        # publisher가 write 토픽을 구독하기 전에 등록되도록 첫 await 전에 넣음
+        writer = OpcUaWriter(server_tag, write_window)
+        write_targets[server_tag] = writer
+        writer.start()
     case = 0
-    subscription_handle_list = []
+    # [(subscription, monitored item handle 목록)]
+    subscriptions = []
 
-    nodes = []
-    if nodes_to_subscribe:
-        for node in nodes_to_subscribe:
-            nodes.append(client.get_node(node))
+    node_priorities = {}
+    poller = None
+    if polling:
+        if events_to_subscribe:
+            print(f"[{server_tag}] events are not available in polling mode, events_to_subscribe ignored")
+            events_to_subscribe = None
+        poller = NodePoller(server_tag, coalescer, codec, node_priorities)
+        scan_period = (scan_interval if scan_interval is not None else poll_interval) / 1000
+        next_scan = 0
+    node_groups = group_nodes(client, nodes_to_subscribe, events_to_subscribe, node_priorities)
+    # client handle은 subscription마다 따로 매겨지므로 handler(node_table)도 subscription마다 하나씩
+    handlers = {
+        publishing_class: SubscriptionHandler(server_tag, coalescer, codec, node_priorities)  # server_tag 전달
+        for publishing_class in node_groups
+    } if not polling else {}
+
+    # 이 서버의 payload 형식을 구독자에게 알림 (content-type 힌트)
+    await send_queue.put(MqttMessage(
+        topic=f"demo/opcua-sub-to-mqtt/{server_tag}/content-type",
+        payload=codec.content_type,
+        qos=1,
+        retain=True
+    ))
 
     while True:
+        if case != stats.state:
+            stats.enter_state(case)
+        if writer is not None and case != 3:
+            writer.client = None
+
         if case == 1:
             print(f"[{server_tag}] connecting...")
             try:
                 await client.connect()
                 print(f"[{server_tag}] connected!")
+                retry_delay = 0
                 case = 2
             except:
                 print(f"[{server_tag}] connection error!")
                 case = 1
-                await asyncio.sleep(2)
+                retry_delay = min(max(retry_delay * 2, reconnect_delay_min), reconnect_delay_max)
+                await asyncio.sleep(retry_delay)
+
+        elif case == 2 and polling:
+            print(f"[{server_tag}] preparing polling...")
+            try:
+                if browse:
+                    discovered = await discover_nodes(client, server_tag, browse)
+                    node_priorities.clear()
+                    node_groups = group_nodes(client, list(nodes_to_subscribe or []) + discovered, None, node_priorities)
+                poller.chunk_size = await read_nodes_per_read_size(client)
+                # 노드별 구독 설정(sampling interval, deadband 등)은 polling에서는 쓰지 않음
+                poller.set_nodes([node for groups in node_groups.values() for nodes in groups.values() for node in nodes])
+                print(f"[{server_tag}] polling {len(poller.read_ids)} nodes every {scan_period * 1000:g} ms "
+                      f"({poller.chunk_size} per Read)")
+                next_scan = time.monotonic()
+                if writer is not None:
+                    await writer.connected(client)
+                case = 3
+            except:
+                print(f"[{server_tag}] polling setup error")
+                case = 4
+                await asyncio.sleep(0)
+
+        elif case == 3 and polling:
+            try:
+                await poller.scan(client)
+            except Exception as e:
+                print(f"[{server_tag}] read error: {e!r}")
+                case = 4
+                continue
+            # 고정 주기로 scan. scan이 주기보다 오래 걸리면 밀린 scan을 몰아서 하지 않고 바로 다음 scan
+            next_scan += scan_period
+            delay = next_scan - time.monotonic()
+            if delay < 0:
+                if poller.overruns == 0:
+                    print(f"[{server_tag}] scan took longer than {scan_period * 1000:g} ms")
+                poller.overruns += 1
+                next_scan = time.monotonic()
+                delay = 0
+            await asyncio.sleep(delay)
 
         elif case == 2:
             print(f"[{server_tag}] subscribing nodes and events...")
+            subscriptions = []
             try:
-                subscription = await client.create_subscription(
-                    period=2000,
-                    handler=handler,
-                    publishing=True
+                if browse:
+                    # browse root 아래 노드를 찾음 (서버 모델이 그대로면 캐시 파일 사용)
+                    discovered = await discover_nodes(client, server_tag, browse)
+                    node_priorities.clear()
+                    node_groups = group_nodes(
+                        client, list(nodes_to_subscribe or []) + discovered, events_to_subscribe, node_priorities
+                    )
+                    for publishing_class in node_groups:
+                        if publishing_class not in handlers:
+                            handlers[publishing_class] = SubscriptionHandler(server_tag, coalescer, codec, node_priorities)
+                # 서버가 한 번의 CreateMonitoredItems 호출에서 받을 수 있는 노드 수
+                chunk_size = await read_operation_limit(
+                    client,
+                    ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxMonitoredItemsPerCall,
+                    monitored_items_per_call,
                 )
-                subscription_handle_list = []
+                for publishing_class, groups in node_groups.items():
+                    handler = handlers[publishing_class]
+                    # 이전 subscription의 client handle 정보는 더 이상 맞지 않음
+                    handler.node_table = {}
+                    handler.bad_status = None
+                    subscription = await client.create_subscription(
+                        period=makeSubscriptionParameters(publishing_intervals[publishing_class]),
+                        handler=handler,
+                        publishing=True
+                    )
+                    handles = []
+                    subscriptions.append((subscription, handles))
 
-                node_handles = await subscription.subscribe_data_change(
-                    nodes=nodes,
-                    attr=ua.AttributeIds.Value,
-                    queuesize=100,
-                    monitoring=ua.MonitoringMode.Reporting
-                )
-                subscription_handle_list.append(node_handles)
-
-                if events_to_subscribe:
-                    for event in events_to_subscribe:
-                        handle = await subscription.subscribe_events(
-                            sourcenode=event[0],
-                            evtypes=event[1],
-                            evfilter=None,
-                            queuesize=50
-                        )
-                        subscription_handle_list.append(handle)
+                    for settings, nodes in groups.items():
+                        handles.extend(await subscribe_node_group(server_tag, subscription, nodes, settings, chunk_size))
+                    handler.build_node_table(subscription)
+
+                    if events_to_subscribe and publishing_class == default_publishing_class:
+                        for event in events_to_subscribe:
+                            handle = await subscription.subscribe_events(
+                                sourcenode=event[0],
+                                evtypes=event[1],
+                                evfilter=None,
+                                queuesize=50
+                            )
+                            handles.append(handle)
 
                 print(f"[{server_tag}] subscribed!")
+                if writer is not None:
+                    await writer.connected(client)
                 case = 3
             except:
                 print(f"[{server_tag}] subscription error")
@@ -258,25 +987,62 @@ async def opcua_client(server_tag, server_url, nodes_to_subscribe, events_to_sub
                 await asyncio.sleep(0)
 
         elif case == 3:
+            if fast_reconnect and client.state is not UaClientState.CONNECTED:
+                case = 5
+                continue
+            problem = find_connection_problem(subscriptions, handlers)
+            if problem:
+                print(f"[{server_tag}] connection problem: {problem}")
+                if fast_reconnect:
+                    # asyncua의 재연결(세션 재활성화 + subscription 이전)을 시작시킴
+                    client.uaclient.notify_transport_lost()
+                    case = 5
+                else:
+                    case = 4
+                continue
+            if service_level_interval and time.monotonic() >= next_service_level_check:
+                next_service_level_check = time.monotonic() + service_level_interval
+                try:
+                    service_level = await client.get_node("ns=0;i=2267").read_value()
+                    if service_level < 200:
+                        case = 4
+                        continue
+                except:
+                    case = 5 if fast_reconnect and client.state is not UaClientState.CONNECTED else 4
+                    continue
+            await asyncio.sleep(watchdog_interval)
+
+        elif case == 5:
+            # asyncua가 새 소켓/채널에서 기존 세션을 다시 활성화하고 subscription을 옮겨옴 (monitored item 유지)
+            print(f"[{server_tag}] connection lost, resuming session...")
             try:
-                service_level = await client.get_node("ns=0;i=2267").read_value()
-                case = 3 if service_level >= 200 else 4
-                await asyncio.sleep(2)
-            except:
+                async with client.subscribe_state() as state:
+                    await state.wait_for_state(UaClientState.CONNECTED, timeout=resume_timeout)
+                print(f"[{server_tag}] session resumed!")
+                if writer is not None:
+                    writer.client = client
+                for handler in handlers.values():
+                    handler.bad_status = None
+                # 이전 subscription을 옮겨오는 동안 keepalive 감시가 다시 끊김으로 보지 않도록 시각을 새로 잡음
+                for subscription, _ in subscriptions:
+                    subscription.last_publish_at = time.monotonic()
+                case = 3
+            except asyncio.TimeoutError:
+                print(f"[{server_tag}] resume failed, resubscribing from scratch")
                 case = 4
 
         elif case == 4:
             print(f"[{server_tag}] unsubscribing...")
-            try:
-                if subscription_handle_list:
-                    await subscription.unsubscribe(subscription_handle_list)
-                await subscription.delete()
-                print(f"[{server_tag}] unsubscribed!")
-            except:
-                print(f"[{server_tag}] unsubscribing error!")
-                subscription = None
-                subscription_handle_list = []
-                await asyncio.sleep(0)
+            for subscription, handles in subscriptions:
+                try:
+                    if handles:
+                        await subscription.unsubscribe(handles)
+                    await subscription.delete()
+                    print(f"[{server_tag}] unsubscribed!")
+                except:
+                    print(f"[{server_tag}] unsubscribing error!")
+                    await asyncio.sleep(0)
+            subscriptions = []
 
             print(f"[{server_tag}] disconnecting...")
             try:
@@ -287,7 +1053,8 @@ async def opcua_client(server_tag, server_url, nodes_to_subscribe, events_to_sub
 
         else:
             case = 1
-            await asyncio.sleep(2)
+            retry_delay = min(max(retry_delay * 2, reconnect_delay_min), reconnect_delay_max)
+            await asyncio.sleep(retry_delay)
 
 
 ####################################################################################
@@ -300,31 +1067,92 @@ async def opcua_client(server_tag, server_url, nodes_to_subscribe, events_to_sub
 'qos : 메시지 전달 품질 (0~2)'
 'retain : 마지막 메시지를 브로커가 기억할지 여부'
 class MqttMessage:
-    def __init__(self, topic, payload, qos, retain=False):
+    def __init__(self, topic, payload, qos, retain=False, priority=PRIORITY_BULK, server_tag=None, source_time=None,
+                 received=None):
         self.topic = topic
         self.payload = payload
         self.qos = qos
         self.retain = retain
+        # send_queue lane (PRIORITY_ALARM: 이벤트/알람, PRIORITY_HIGH: priority 태그, PRIORITY_BULK: 나머지)
+        self.priority = priority
+        # 지연 추적용 (time.time() 기준 초). server_tag가 없으면 기록하지 않음
+        # source_time: OPC UA SourceTimestamp, received: 알림 수신, enqueued: send_queue에 넣음, dequeued: publisher가 꺼냄
+        self.server_tag = server_tag
+        self.source_time = source_time
+        self.received = received
+        self.enqueued = None
+        self.dequeued = None
+        # array delta 모드의 배열 값이면 (ArrayDeltaTracker, key)
+        self.delta = None
+
+# queue 정책 때문에 버린 메시지가 array keyframe/delta였으면 그 노드의 다음 값은 keyframe으로 보냄
+# (그 뒤의 delta는 구독자가 받지 못한 배열을 기준으로 하므로 keyframe_interval까지 기다리지 않고 바로 다시 맞춤)
+def forget_dropped_delta(message):
+    if getattr(message, "delta", None) is not None:
+        tracker, key = message.delta
+        tracker.force_keyframe(key)
+
+# send_queue(버스)에서 브로커로 보낼 MqttMessage만 받는 퍼블리셔용 queue
+# (MQTT 상태 메시지, serial 메시지는 GUI consumer만 받음. GUI가 느려도 이 queue에는 영향 없음)
+mqtt_queue = send_queue.subscribe(
+    "mqtt", send_queue_maxsize, send_queue_policy,
+    accept=lambda message: isinstance(message, MqttMessage)
+)
+mqtt_queue.on_drop = forget_dropped_delta
 
 # MQTT 브로커에 연결하고, 큐에 쌓인 메시지를 발행
-async def publisher():
+# stats: 연결 풀에서 연결별 통계 dict (publish_stats 합계와 별도로 셈)
+# subscribe_writes: write_enabled 서버가 있으면 이 연결로 write 토픽을 구독 (연결 풀에서는 첫 번째 연결만)
+# drain: 연결되기 전까지 queue를 디스크로 옮기는 task (연결되면 취소하고 spool 재전송부터 함)
+async def publisher(spool: MessageSpool = None, queue: asyncio.Queue = mqtt_queue, stats=None, subscribe_writes=True,
+                    drain: asyncio.Task = None):
     async with AsyncExitStack() as stack:
         tasks = set()
         stack.push_async_callback(cancel_tasks, tasks)
-        mqtt_client = MqttClient(hostname=broker_ip, port=broker_port)
+        if publish_mode == "pipelined":
+            mqtt_client = MqttClient(
+                hostname=broker_ip, port=broker_port,
+                max_inflight_messages=publish_window
+            )
+            # window만큼 ACK를 기다리는 것은 정상이므로 aiomqtt가 publish마다 경고 로그를 찍지 않게 함
+            mqtt_client.pending_calls_threshold = publish_window
+        else:
+            mqtt_client = MqttClient(hostname=broker_ip, port=broker_port)
         try:
             await stack.enter_async_context(mqtt_client)
+            if drain is not None:
+                drain.cancel()
+            if stats is not None:
+                stats["connects"] += 1
+                stats["connected"] = True
             # 상태: CONNECTED
             await send_queue.put(MQTTStatusMessage(
                 status="CONNECTED", broker=broker_ip, port=broker_port,
                 topics="demo/opcua-sub-to-mqtt/#", detail="연결됨"
             ))
 
-            task = asyncio.create_task(publish_messages(mqtt_client, send_queue))
+            if subscribe_writes and write_targets:
+                await mqtt_client.subscribe("demo/opcua-sub-to-mqtt/+/write/#", qos=1)
+                tasks.add(asyncio.create_task(receive_writes(mqtt_client)))
+
+            if spool is not None and spool.pending:
+                print(f"replaying {spool.pending} spooled messages...")
+                await replay_spool(mqtt_client, queue, spool, stats)
+            # 재전송이 끝났으니 넘치는 메시지는 다시 queue 정책대로 처리
+            queue.spill = None
+
+            if publish_mode == "pipelined":
+                task = asyncio.create_task(
+                    publish_messages_pipelined(mqtt_client, queue, publish_window, stats, spool)
+                )
+            else:
+                task = asyncio.create_task(publish_messages(mqtt_client, queue, stats, spool))
             tasks.add(task)
 
             await asyncio.gather(*tasks)
         except Exception as e:
+            if stats is not None:
+                stats["connected"] = False
             # 상태: ERROR
             await send_queue.put(MQTTStatusMessage(
                 status="ERROR", broker=broker_ip, port=broker_port,
@@ -332,8 +1160,20 @@ async def publisher():
             ))
             raise
 
+# write 토픽으로 받은 요청을 server_tag의 OpcUaWriter로 넘김 (토픽: demo/opcua-sub-to-mqtt/{server_tag}/write/{nodeid})
+async def receive_writes(client: MqttClient):
+    async for message in client.messages:
+        parts = message.topic.value.split("/", 4)
+        if len(parts) < 5 or parts[3] != "write":
+            continue
+        writer = write_targets.get(parts[2])
+        if writer is not None:
+            # retain 플래그는 브로커에 남아 있던 예전 명령에만 붙음 (재연결, bridge 재시작마다 다시 오므로 쓰면 안 됨)
+            writer.put(parts[4], message.payload, retained=message.retain)
+
 # send_queue에서 메시지를 하나씩 꺼내서 MQTT 브로커로 보냄
-async def publish_messages(client: MqttClient, queue: asyncio.Queue[MqttMessage]):
+# spool이 있으면 ACK를 받지 못한 메시지를 디스크에 넣고 끝냄 (재연결 후 다시 보냄)
+async def publish_messages(client: MqttClient, queue: asyncio.Queue[MqttMessage], stats=None, spool: MessageSpool = None):
     while True:
         get = asyncio.create_task(
             queue.get() # OPC UA 에서 들어온 데이터를 기다림
@@ -343,8 +1183,107 @@ async def publish_messages(client: MqttClient, queue: asyncio.Queue[MqttMessage]
         )
         if get in done:
             message: MqttMessage = get.result()
-            await client.publish(message.topic, message.payload, message.qos, retain=True)
-        
+            message.dequeued = time.time()
+            try:
+                await client.publish(message.topic, message.payload, message.qos, retain=message.retain)
+            except (MqttError, asyncio.CancelledError) as e:
+                if spool is not None:
+                    spool.append([message])
+                if isinstance(e, MqttError):
+                    publish_stats["errors"] += 1
+                    if stats is not None:
+                        stats["errors"] += 1
+                raise
+            publish_stats["published"] += 1
+            if stats is not None:
+                stats["published"] += 1
+            record_latency(message, time.time())
+        else:
+            get.cancel()
+            raise MqttError("Disconnected from broker while publishing")
+
+# send_queue에 쌓인 메시지를 한 번에 꺼내서, 최대 window 개까지 ACK를 기다리지 않고 동시에 보냄
+async def publish_messages_pipelined(client: MqttClient, queue: asyncio.Queue[MqttMessage], window: int, stats=None,
+                                     spool: MessageSpool = None):
+    """
+    Drains the queue in batches and keeps up to `window` QoS1 publishes in flight,
+    so throughput is no longer capped at one broker round trip per message.
+    When the connection fails, the publishes that were not acknowledged go to the
+    spool (if any) before everything still in the queue.
+    """
+    inflight = asyncio.Semaphore(window)
+    # publish task → 메시지 (ACK를 받으면 빠짐)
+    pending = {}
+    # publish가 실패한 메시지
+    unacked = []
+    failed = asyncio.get_running_loop().create_future()
+
+    async def publish_one(message: MqttMessage):
+        try:
+            await client.publish(message.topic, message.payload, message.qos, retain=message.retain)
+            publish_stats["published"] += 1
+            if stats is not None:
+                stats["published"] += 1
+            record_latency(message, time.time())
+        except MqttError as e:
+            unacked.append(message)
+            publish_stats["errors"] += 1
+            if stats is not None:
+                stats["errors"] += 1
+            if not failed.done():
+                failed.set_exception(e)
+        finally:
+            inflight.release()
+
+    # aw가 끝날 때까지 기다림. 그 전에 브로커 연결이 끊기거나 publish가 실패하면 publisher()가 다시 연결하도록 예외를 올림
+    # (window가 꽉 찬 채로 끊기면 ACK가 오지 않아 acquire도 끝나지 않으므로 acquire도 같이 기다림)
+    async def wait_connected(aw):
+        task = asyncio.ensure_future(aw)
+        done, _ = await asyncio.wait(
+            (task, client._disconnected, failed), return_when=asyncio.FIRST_COMPLETED
+        )
+        if task not in done:
+            task.cancel()
+            if failed.done():
+                raise failed.exception()
+            raise MqttError("Disconnected from broker while publishing")
+        return task.result()
+
+    try:
+        while True:
+            # window에 빈 자리가 생긴 뒤에 꺼냄. 미리 많이 꺼내 두면 나중에 들어온 알람이 그 뒤에서 기다려야 함
+            await wait_connected(inflight.acquire())
+            try:
+                message = await wait_connected(queue.get())
+            except MqttError:
+                inflight.release()
+                raise
+
+            # window에 남은 자리만큼 더 꺼냄 (자리가 있으면 acquire는 기다리지 않음)
+            batch = [message]
+            while len(batch) < publish_batch_size and not inflight.locked():
+                try:
+                    message = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                await inflight.acquire()
+                batch.append(message)
+
+            dequeued = time.time()
+            for message in batch:
+                message.dequeued = dequeued
+                task = asyncio.create_task(publish_one(message))
+                pending[task] = message
+                task.add_done_callback(pending.pop)
+    finally:
+        # 끊길 때 window 안에 있던 publish는 취소되므로 ACK를 못 받은 메시지를 spool에 넣음
+        # (브로커가 이미 받았을 수도 있어서 재연결 후 중복될 수 있음: at-least-once)
+        unacked.extend(message for task, message in pending.items() if not task.done())
+        for task in list(pending):
+            task.cancel()
+        if spool is not None and unacked:
+            spool.append(unacked)
+
 async def cancel_tasks(tasks):
     for task in tasks:
         task.cancel()
@@ -353,28 +1292,236 @@ async def cancel_tasks(tasks):
         except asyncio.CancelledError:
             pass
 
-async def async_mqtt_client():
+# send_queue에 있는 메시지를 모두 디스크로 옮김
+def drain_queue_to_spool(queue: asyncio.Queue[MqttMessage], spool: MessageSpool):
+    messages = []
+    while True:
+        try:
+            messages.append(queue.get_nowait())
+        except asyncio.QueueEmpty:
+            break
+    if messages:
+        spool.append(messages)
+
+# 브로커에 연결되지 않은 동안 queue를 주기적으로 디스크로 옮김 (연결되면 publisher()가 취소함)
+async def spool_messages(queue: asyncio.Queue[MqttMessage], spool: MessageSpool):
+    while True:
+        drain_queue_to_spool(queue, spool)
+        await asyncio.sleep(spool_drain_interval)
+
+# 연결되지 않은 동안 spool에 옮기기 시작: 주기적인 drain task + 주기 사이에 queue가 넘치면 그 자리에서 옮김
+# (넘칠 때 옮기는 것은 publisher()가 재전송을 끝낸 뒤 끔)
+def start_spooling(queue: BoundedSendQueue, spool: MessageSpool):
+    if spool is None:
+        return None
+    queue.spill = lambda q: drain_queue_to_spool(q, spool)
+    return asyncio.create_task(spool_messages(queue, spool))
+
+# mqtt_connections를 바꾸면 예전 spool 파일("{spool_path}" 또는 "{spool_path}.{번호}")은 더 이상 다시 보내지 않음
+# 시작할 때 지금 쓰지 않는 파일에 남은 메시지를 topic 해시(MqttConnectionPool.route와 같음)로 지금 spool에 옮기고 예전 파일은 지움
+def adopt_leftover_spools(spool_path, spools):
+    current = {os.path.abspath(spool.path) for spool in spools}
+    directory, base = os.path.split(os.path.abspath(spool_path))
+    pattern = re.compile(re.escape(base) + r"(\.\d+)?")
+    leftovers = sorted(
+        (name for name in os.listdir(directory) if pattern.fullmatch(name)),
+        key=lambda name: int(name[len(base) + 1:]) if name != base else -1
+    )
+    for name in leftovers:
+        path = os.path.join(directory, name)
+        if path in current:
+            continue
+        old = MessageSpool(path)
+        moved = 0
+        while batch := old.read(spool_batch_size):
+            targets = {}
+            for _, topic, payload, qos, retain in batch:
+                spool = spools[zlib.crc32(topic.encode()) % len(spools)]
+                targets.setdefault(spool, []).append(MqttMessage(topic, payload, qos, bool(retain)))
+            for spool, messages in targets.items():
+                spool.append(messages)
+            old.ack(batch[-1][0])
+            moved += len(batch)
+        old.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        print(f"spool: moved {moved} message(s) from leftover {path}")
+
+# 디스크에 쌓인 메시지를 오래된 순서대로 spool_replay_rate 속도로 보냄
+# 배치 전체가 ACK된 뒤에만 offset을 저장하므로, 중간에 끊기면 그 배치부터 다시 보냄 (at-least-once)
+async def replay_spool(client: MqttClient, queue: asyncio.Queue[MqttMessage], spool: MessageSpool, stats=None):
+    loop = asyncio.get_running_loop()
+    while spool.pending:
+        # 재전송 중에 새로 들어온 메시지도 순서를 지키기 위해 디스크 뒤쪽에 붙임
+        drain_queue_to_spool(queue, spool)
+        started = loop.time()
+        batch = spool.read(spool_batch_size)
+        if not batch:
+            break
+        try:
+            await asyncio.gather(*(
+                client.publish(topic, payload, qos, retain=retain)
+                for _, topic, payload, qos, retain in batch
+            ))
+        except MqttError:
+            publish_stats["errors"] += 1
+            if stats is not None:
+                stats["errors"] += 1
+            raise
+        spool.ack(batch[-1][0])
+        publish_stats["published"] += len(batch)
+        if stats is not None:
+            stats["published"] += len(batch)
+        if spool_replay_rate:
+            delay = len(batch) / spool_replay_rate - (loop.time() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+# 서버별 지연 시간 요약을 주기적으로 send_queue에 넣음 (다른 메시지와 같은 경로로 발행됨)
+async def publish_latency_summary(interval):
+    while True:
+        await asyncio.sleep(interval)
+        for server_tag, stages in metrics.latency_stats().items():
+            await send_queue.put(MqttMessage(
+                topic=f"demo/opcua-sub-to-mqtt/{server_tag}/latency",
+                payload=json.dumps(stages),
+                qos=0,
+                retain=True
+            ))
+
+# 연결 하나의 재연결 루프: 끊기면 3초 뒤 다시 연결
+# spool이 있으면 연결되지 않은 동안(연결 시도 중, aiomqtt는 최대 10초 + 재시도 대기) 계속 queue를 디스크로 옮김
+async def mqtt_connection_loop(queue: asyncio.Queue, spool: MessageSpool = None, stats=None, subscribe_writes=True):
     while True:
+        drain = start_spooling(queue, spool)
         try:
-            await publisher()
+            await publisher(spool, queue, stats, subscribe_writes, drain)
         except MqttError as e:
             print(e)
+            # 다시 연결하기 전 대기 중에도 계속 디스크로 옮김
+            if drain is not None:
+                drain.cancel()
+            drain = start_spooling(queue, spool)
             await asyncio.sleep(3)
+        finally:
+            if drain is not None:
+                drain.cancel()
+
+# MQTT 연결 K개: mqtt_queue에서 꺼낸 메시지를 topic 해시로 연결별 queue에 나눠 넣음
+class MqttConnectionPool:
+    """
+    K MQTT connections, each with its own queue, reconnect loop and (optional) spool.
+    Messages are routed by crc32(topic) % K, so every topic always goes out on
+    the same connection and stays in order.
+    """
+
+    def __init__(self, size, spool_path=None):
+        self.size = size
+        lane_maxsize = max(1, mqtt_queue.maxsize // size) if mqtt_queue.maxsize > 0 else 0
+        self.queues = [BoundedSendQueue(lane_maxsize, mqtt_queue.policy) for _ in range(size)]
+        for queue in self.queues:
+            queue.on_drop = forget_dropped_delta
+        self.spools = [
+            MessageSpool(f"{spool_path}.{i}") if spool_path else None
+            for i in range(size)
+        ]
+        self.connection_stats = [
+            {"published": 0, "errors": 0, "connects": 0, "connected": False}
+            for _ in range(size)
+        ]
+
+    def route(self, topic):
+        return self.queues[zlib.crc32(topic.encode()) % self.size]
+
+    # mqtt_queue가 dispatch()보다 먼저 넘치면(한 번에 큰 burst) 버리지 않고 바로 연결별 queue로 옮김
+    # 연결별 queue도 넘치면 그 queue의 spill(연결되지 않은 동안 spool) 또는 정책을 따름
+    def spill(self, queue):
+        while True:
+            try:
+                message = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            self.route(message.topic).put_nowait(message)
+
+    async def dispatch(self):
+        while True:
+            message = await mqtt_queue.get()
+            queue = self.route(message.topic)
+            if queue.policy == OVERFLOW_BLOCK:
+                await queue.put(message)
+            else:
+                queue.put_nowait(message)
+
+    async def run(self):
+        # block 정책이면 mqtt_queue는 넘쳐도 버리지 않고 producer를 기다리게 하므로 그대로 둠
+        if mqtt_queue.policy != OVERFLOW_BLOCK:
+            mqtt_queue.spill = self.spill
+        await asyncio.gather(
+            self.dispatch(),
+            *(
+                mqtt_connection_loop(queue, spool, stats, i == 0)
+                for i, (queue, spool, stats) in enumerate(zip(self.queues, self.spools, self.connection_stats))
+            )
+        )
+
+    def stats(self):
+        return [
+            dict(
+                stats,
+                connection=i,
+                queue=queue.stats(),
+                spool_pending=spool.pending if spool is not None else 0,
+            )
+            for i, (queue, spool, stats) in enumerate(zip(self.queues, self.spools, self.connection_stats))
+        ]
+
+async def async_mqtt_client():
+    if mqtt_connections > 1:
+        pool = MqttConnectionPool(mqtt_connections, spool_path)
+        if spool_path:
+            adopt_leftover_spools(spool_path, pool.spools)
+        metrics.mqtt_pool = pool
+        await pool.run()
+    else:
+        spool = MessageSpool(spool_path) if spool_path else None
+        if spool is not None:
+            adopt_leftover_spools(spool_path, [spool])
+        await mqtt_connection_loop(mqtt_queue, spool)
 
 ####################################################################################
 # Run:
 ####################################################################################
 
-async def main():
+# 설정 파일(JSON/TOML/YAML)을 읽어서 server_configs와 브로커 설정을 교체
+def apply_config_file(path):
+    global server_configs, broker_ip, broker_port
+    config = load_bridge_config(path)
+    server_configs = config["server_configs"]
+    broker_ip = config["broker_ip"]
+    broker_port = config["broker_port"]
+
+async def main(configs=None):
     tasks = []
 
-    for config in server_configs:
+    if configs is None:
+        configs = server_configs
+
+    for config in configs:
         task = asyncio.create_task(
             opcua_client(
                 config["server_tag"], 
                 config["server_url"],
                 config["nodes_to_subscribe"],
-                config["events_to_subscribe"]
+                config["events_to_subscribe"],
+                config.get("coalesce_window", coalesce_window),
+                config.get("payload_codec", default_payload_codec),
+                config.get("browse"),
+                config.get("array_encoding", default_array_encoding),
+                config.get("array_delta", default_array_delta),
+                config.get("acquisition", default_acquisition),
+                config.get("poll_interval"),
+                config.get("write_enabled", default_write_enabled)
             )
         )
         tasks.append(task)
@@ -382,11 +1529,22 @@ async def main():
     mqtt_task = asyncio.create_task(async_mqtt_client())
     tasks.append(mqtt_task)
 
+    if metrics_port:
+        tasks.append(asyncio.create_task(serve_metrics(metrics_host, metrics_port)))
+    if latency_summary_interval:
+        tasks.append(asyncio.create_task(publish_latency_summary(latency_summary_interval)))
+
     await asyncio.gather(*tasks)
 
 
 # 이 파일이 스크립트로 직접 실행될 때만 아래 블록을 실행하겠다는 의미. 모듈로 import되었을 경우에는 실행되지 않음.
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OPC UA subscription → MQTT bridge")
+    parser.add_argument("--config", help="bridge config file (.json / .toml / .yaml)")
+    args = parser.parse_args()
+    if args.config:
+        apply_config_file(args.config)
+
     if platform.lower() == "win32" or name.lower() == "nt":
         from asyncio import (
             set_event_loop_policy,
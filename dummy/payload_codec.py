@@ -0,0 +1,430 @@
+# payload_codec.py
+# OPC UA DataValue → MQTT payload 변환을 빠르게 하기 위한 인코더
+import base64
+import json
+import time
+from datetime import datetime
+
+from asyncua import ua
+
+_EPOCH = datetime(1970, 1, 1)
+
+# str() 결과에 JSON escape가 필요 없는 값 타입 → 따옴표만 붙이면 됨
+_PLAIN_TYPES = {int, float, bool}
+
+
+# dt.replace(tzinfo=timezone.utc).timestamp()와 같은 값
+# 시각을 UTC로 보고 epoch와의 차이만 계산하면 되므로 tz 변환을 거치지 않음
+def epochSeconds(dt: datetime):
+    if dt.tzinfo is not None:
+        dt = dt.replace(tzinfo=None)
+    return (dt - _EPOCH).total_seconds()
+
+
+# str(dt.replace(tzinfo=timezone.utc).timestamp())와 같은 문자열을 만듦
+def timestampString(dt: datetime):
+    return str(epochSeconds(dt))
+
+
+####################################################################################
+# Array encoding:
+####################################################################################
+# 배열 값 인코딩 방식 (서버별로 server_configs의 "array_encoding" 키로 선택)
+# "string"  : 기존처럼 str(list)
+# "ndarray" : NumPy로 묶어서 {"Encoding", "DType", "Shape", "Data"} 블록으로 보냄
+#             Data는 little-endian 원시 바이트 (JSON은 base64 문자열, msgpack/cbor는 bytes 그대로)
+# "array_delta"(keyframe 주기, 초)를 켜면 ndarray 블록 대신 바뀐 구간만 보냄 (ArrayDeltaTracker 참고)
+ARRAY_ENCODING_STRING = "string"
+ARRAY_ENCODING_NDARRAY = "ndarray"
+ARRAY_ENCODING_NDARRAY_DELTA = "ndarray-delta"
+ARRAY_ENCODINGS = (ARRAY_ENCODING_STRING, ARRAY_ENCODING_NDARRAY)
+
+# 숫자/불리언 VariantType → little-endian NumPy dtype (나머지 타입의 배열은 기존 방식으로 보냄)
+NDARRAY_DTYPES = {
+    ua.VariantType.Boolean: "|b1",
+    ua.VariantType.SByte: "|i1",
+    ua.VariantType.Byte: "|u1",
+    ua.VariantType.Int16: "<i2",
+    ua.VariantType.UInt16: "<u2",
+    ua.VariantType.Int32: "<i4",
+    ua.VariantType.UInt32: "<u4",
+    ua.VariantType.Int64: "<i8",
+    ua.VariantType.UInt64: "<u8",
+    ua.VariantType.Float: "<f4",
+    ua.VariantType.Double: "<f8",
+}
+
+_numpy = None
+
+def _import_numpy():
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("array_encoding 'ndarray' needs the numpy package (pip install numpy)")
+        _numpy = numpy
+    return _numpy
+
+# 배열 Variant → NumPy 배열 (little-endian dtype). 숫자 배열이 아니면 None
+def makeNdarray(v: ua.Variant):
+    value = v.Value
+    if not isinstance(value, (list, tuple)):
+        return None
+    dtype = NDARRAY_DTYPES.get(v.VariantType)
+    if dtype is None:
+        return None
+    array = _numpy.asarray(value, dtype=dtype)
+    # 행렬은 ArrayDimensions 모양으로 (값이 평평한 list로 온 경우)
+    if v.Dimensions and len(v.Dimensions) > 1 and array.ndim == 1 and array.size == _numpy.prod(v.Dimensions):
+        array = array.reshape(v.Dimensions)
+    return array
+
+def _blockData(data, binary):
+    return data if binary else base64.b64encode(data).decode("ascii")
+
+def makeNdarrayDict(array, binary=False, **extra):
+    block = {
+        "Encoding": ARRAY_ENCODING_NDARRAY,
+        "DType": array.dtype.str,
+        "Shape": list(array.shape),
+        "Data": _blockData(array.tobytes(), binary),
+    }
+    block.update(extra)
+    return block
+
+
+class ArrayDeltaTracker:
+    """
+    Remembers the last array sent per node key and turns the next one into:
+      - a keyframe (normal ndarray block + "Seq", "Keyframe": true) for the first value,
+        after keyframe_interval seconds, or when dtype/shape/status changed
+        or more than max_delta_ratio of the elements changed,
+      - a delta {"Encoding": "ndarray-delta", "DType", "Shape", "Seq",
+        "Ranges": [[start, end), ...], "Data"}, where Ranges are flat (C-order)
+        indices and Data holds the new values of those ranges back to back,
+      - nothing (None) when no element and no status changed.
+    Every delta applies to the array of the previous Seq; a consumer that sees a
+    gap in Seq (e.g. a message dropped by the send_queue policy) waits for the next keyframe;
+    the publisher calls force_keyframe() for a dropped message, so that keyframe comes with
+    the node's next change.
+    The key must be unique across subscriptions (the nodeid, not the client handle:
+    asyncua numbers the handles of every subscription from 201).
+    """
+
+    def __init__(self, keyframe_interval, min_gap=8, max_delta_ratio=0.5):
+        self.keyframe_interval = keyframe_interval
+        # 이 개수보다 가까운 구간은 하나로 합침 (구간이 잘게 쪼개지면 Ranges가 더 커짐)
+        self.min_gap = min_gap
+        self.max_delta_ratio = max_delta_ratio
+        # key → [마지막 배열, status code, seq, 마지막 keyframe 시각, 마지막으로 보낸 것이 delta인지]
+        self.last = {}
+        self.keyframes = 0
+        self.deltas = 0
+        self.suppressed = 0
+
+    def update(self, key, array, status, binary=False):
+        np = _numpy
+        now = time.monotonic()
+        state = self.last.get(key)
+        if (
+            state is None
+            or state[0].shape != array.shape
+            or state[0].dtype != array.dtype
+            or state[1] != status
+            or now - state[3] >= self.keyframe_interval
+        ):
+            return self._keyframe(key, array, status, state, now, binary)
+
+        previous = state[0]
+        changed = previous != array
+        if array.dtype.kind == "f":
+            # NaN → NaN은 바뀐 것으로 보지 않음
+            changed &= ~(np.isnan(previous) & np.isnan(array))
+        changed = changed.ravel()
+        if not changed.any():
+            self.suppressed += 1
+            return None
+
+        # 바뀐 원소가 연속된 구간 [start, end)
+        padded = np.zeros(changed.size + 2, np.int8)
+        padded[1:-1] = changed
+        edges = np.flatnonzero(np.diff(padded))
+        starts, ends = edges[0::2], edges[1::2]
+        if len(starts) > 1 and self.min_gap:
+            keep = np.concatenate(([True], starts[1:] - ends[:-1] >= self.min_gap))
+            ends = np.concatenate((ends[:-1][keep[1:]], ends[-1:]))
+            starts = starts[keep]
+        if (ends - starts).sum() > self.max_delta_ratio * changed.size:
+            return self._keyframe(key, array, status, state, now, binary)
+
+        marks = np.zeros(changed.size + 1, np.int32)
+        marks[starts] += 1
+        marks[ends] -= 1
+        covered = np.cumsum(marks[:-1]) > 0
+        state[0] = array
+        state[2] += 1
+        state[4] = True
+        self.deltas += 1
+        return {
+            "Encoding": ARRAY_ENCODING_NDARRAY_DELTA,
+            "DType": array.dtype.str,
+            "Shape": list(array.shape),
+            "Seq": state[2],
+            "Ranges": np.stack((starts, ends), axis=1).tolist(),
+            "Data": _blockData(array.ravel()[covered].tobytes(), binary),
+        }
+
+    def _keyframe(self, key, array, status, state, now, binary):
+        seq = state[2] + 1 if state is not None else 0
+        self.last[key] = [array, status, seq, now, False]
+        self.keyframes += 1
+        return makeNdarrayDict(array, binary, Seq=seq, Keyframe=True)
+
+    # 마지막 update가 delta를 만들었는지 (delta는 retain하지 않고 keyframe만 retain)
+    def last_was_delta(self, key):
+        state = self.last.get(key)
+        return state is not None and state[4]
+
+    # 이 key의 배열을 추적하고 있는지 (마지막 값이 배열이었는지)
+    def tracks(self, key):
+        return key in self.last
+
+    # 보낸 keyframe/delta가 구독자에게 가지 못했을 때: 다음 update는 keyframe (Seq는 이어서 증가)
+    def force_keyframe(self, key):
+        state = self.last.get(key)
+        if state is not None:
+            state[3] = float("-inf")
+
+
+# 숫자 배열 값이면 ndarray(또는 delta) 블록, 아니면 None
+# delta 모드에서 바뀐 값이 없으면 SUPPRESSED (이번 알림은 보내지 않음)
+SUPPRESSED = object()
+
+def makeArrayBlock(key, dv: ua.DataValue, delta, binary):
+    array = makeNdarray(dv.Value)
+    if array is None:
+        return None
+    if delta is None:
+        return makeNdarrayDict(array, binary)
+    block = delta.update(key, array, dv.StatusCode.value, binary)
+    return SUPPRESSED if block is None else block
+
+
+class DataValueJsonEncoder:
+    """
+    Writes the same JSON as makeJsonStringFromDict(makeDictFromDataValue(dv)),
+    but directly as bytes and without building the intermediate dicts.
+    The constant parts are cached: VariantType/ArrayDimensions per node key
+    and the Value/Text fragment per status code.
+    With array_encoding "ndarray", numeric arrays are written as a base64 block instead of str(list);
+    with an ArrayDeltaTracker only the changed ranges are written, and encode() returns None
+    when nothing changed.
+    """
+
+    def __init__(self, array_encoding=ARRAY_ENCODING_STRING, delta=None):
+        self._variant_parts = {}
+        self._status_parts = {}
+        self.ndarray = array_encoding == ARRAY_ENCODING_NDARRAY or delta is not None
+        self.delta = delta
+        if self.ndarray:
+            _import_numpy()
+
+    def encode(self, key, dv: ua.DataValue):
+        '''
+        key: anything that identifies the node across subscriptions (e.g. the nodeid string)
+        '''
+        v = dv.Value
+        value = v.Value
+        if type(value) in _PLAIN_TYPES:
+            value_part = '"' + str(value) + '"'
+        elif self.ndarray and type(value) is list and (block := makeArrayBlock(key, dv, self.delta, False)) is not None:
+            if block is SUPPRESSED:
+                return None
+            value_part = json.dumps(block)
+        else:
+            value_part = json.dumps(str(value))
+
+        cached = self._variant_parts.get(key)
+        if cached is None or cached[0] is not v.VariantType or cached[1] != v.Dimensions:
+            cached = (v.VariantType, v.Dimensions, self._make_variant_tail(v))
+            self._variant_parts[key] = cached
+
+        status_value = dv.StatusCode.value
+        status_part = self._status_parts.get(status_value)
+        if status_part is None:
+            status_part = self._make_status_part(dv.StatusCode)
+            self._status_parts[status_value] = status_part
+
+        src = dv.SourceTimestamp
+        srv = dv.ServerTimestamp
+        return "".join((
+            '{"Value": {"Value": ', value_part,
+            cached[2],
+            status_part,
+            ', "SourceTimestamp": ', '"' + timestampString(src) + '"' if src else "null",
+            ', "ServerTimestamp": ', '"' + timestampString(srv) + '"' if srv else "null",
+            "}",
+        )).encode()
+
+    # Value 뒤에 오는 ArrayDimensions, VariantType 부분 (노드마다 거의 바뀌지 않음)
+    @staticmethod
+    def _make_variant_tail(v: ua.Variant):
+        return (
+            ', "ArrayDimensions": ' + json.dumps(str(v.Dimensions))
+            + ', "VariantType": {"Value": ' + json.dumps(str(v.VariantType.value))
+            + ', "Name": ' + json.dumps(str(v.VariantType.name))
+            + '}}, "Status": '
+        )
+
+    @staticmethod
+    def _make_status_part(st: ua.StatusCode):
+        return '{"Value": ' + json.dumps(str(st.value)) + ', "Text": ' + json.dumps(str(st.name)) + '}'
+
+
+####################################################################################
+# Payload codecs:
+####################################################################################
+# 서버별로 server_configs의 "payload_codec" 키로 선택
+CODEC_JSON = "json"
+CODEC_MSGPACK = "msgpack"
+CODEC_CBOR = "cbor"
+
+# 바이너리 코덱용 값 변환: 숫자/불리언/문자열은 그대로 두고(str() 하지 않음), 나머지만 변환
+def makeNativeValue(value):
+    if value is None or type(value) in _PLAIN_TYPES or isinstance(value, (str, bytes)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [makeNativeValue(x) for x in value]
+    if isinstance(value, datetime):
+        return float(timestampString(value))
+    if isinstance(value, ua.NodeId):
+        return value.to_string()
+    if isinstance(value, ua.LocalizedText):
+        return {"Locale": value.Locale, "Text": value.Text}
+    return str(value)
+
+# makeDictFromVariant와 같은 구조지만 값은 원래 타입 그대로
+# array_block이 있으면 Value 자리에 그 블록(makeArrayBlock 결과)을 넣음
+def makeNativeDictFromVariant(v: ua.Variant, array_block=None):
+    return {
+        "Value": array_block if array_block is not None else makeNativeValue(v.Value),
+        "ArrayDimensions": v.Dimensions,
+        "VariantType": {
+            "Value": v.VariantType.value,
+            "Name": v.VariantType.name
+        }
+    }
+
+def makeNativeDictFromDataValue(dv: ua.DataValue, array_block=None):
+    return {
+        "Value": makeNativeDictFromVariant(dv.Value, array_block),
+        "Status": {
+            "Value": dv.StatusCode.value,
+            "Text": dv.StatusCode.name,
+        },
+        "SourceTimestamp": float(timestampString(dv.SourceTimestamp)) if dv.SourceTimestamp else None,
+        "ServerTimestamp": float(timestampString(dv.ServerTimestamp)) if dv.ServerTimestamp else None,
+    }
+
+# makeDictFromEventData와 같은 필드 구성
+def makeNativeDictFromEventData(event):
+    fields = {
+        "EventType": event["EventType"].Value.to_string(),
+        "SourceName": makeNativeValue(event["SourceName"].Value),
+        "SourceNode": event["SourceNode"].Value.to_string(),
+        "Severity": makeNativeDictFromVariant(event["Severity"]),
+        "Message": makeNativeValue(event["Message"].Value),
+        "LocalTime": {
+            "Offset": event["LocalTime"].Value.Offset,
+            "DaylightSavingInOffset": event["LocalTime"].Value.DaylightSavingInOffset
+        }
+    }
+    for key in event.keys():
+        if key not in fields:
+            fields[key] = makeNativeDictFromVariant(event[key])
+    return fields
+
+
+class JsonPayloadCodec:
+    """
+    The original JSON layout (every value as string), written by DataValueJsonEncoder.
+    Events keep going through makeDictFromEventData in the publisher.
+    """
+    name = CODEC_JSON
+
+    def __init__(self, array_encoding=ARRAY_ENCODING_STRING, delta=None):
+        self.delta = delta
+        self.encoder = DataValueJsonEncoder(array_encoding, delta)
+        self.content_type = makeContentType("application/json", array_encoding, delta)
+
+    def encode_datavalue(self, key, dv: ua.DataValue):
+        return self.encoder.encode(key, dv)
+
+
+class BinaryPayloadCodec:
+    """
+    MessagePack/CBOR payloads with the same field layout as the JSON payload,
+    but with native numeric types instead of strings.
+    With array_encoding "ndarray", numeric arrays carry their raw little-endian bytes
+    (or only the changed ranges with an ArrayDeltaTracker; None when nothing changed).
+    """
+
+    def __init__(self, name, content_type, dumps, array_encoding=ARRAY_ENCODING_STRING, delta=None):
+        self.name = name
+        self.content_type = makeContentType(content_type, array_encoding, delta)
+        self.dumps = dumps
+        self.ndarray = array_encoding == ARRAY_ENCODING_NDARRAY or delta is not None
+        self.delta = delta
+        if self.ndarray:
+            _import_numpy()
+
+    def encode_datavalue(self, key, dv: ua.DataValue):
+        block = None
+        if self.ndarray and type(dv.Value.Value) is list:
+            block = makeArrayBlock(key, dv, self.delta, True)
+            if block is SUPPRESSED:
+                return None
+        return self.dumps(makeNativeDictFromDataValue(dv, block))
+
+    def encode_event(self, event):
+        return self.dumps(makeNativeDictFromEventData(event))
+
+
+# content-type 힌트에 배열 인코딩도 표시 (예: "application/json; arrays=ndarray")
+def makeContentType(content_type, array_encoding, delta=None):
+    if array_encoding not in ARRAY_ENCODINGS:
+        raise ValueError(f"unknown array encoding: {array_encoding}")
+    if delta is not None:
+        return f"{content_type}; arrays={ARRAY_ENCODING_NDARRAY_DELTA}"
+    if array_encoding == ARRAY_ENCODING_STRING:
+        return content_type
+    return f"{content_type}; arrays={array_encoding}"
+
+
+# 이름으로 코덱을 만듦. msgpack/cbor2/numpy 패키지는 해당 기능을 쓸 때만 필요함
+# array_delta: 숫자 배열을 delta로 보낼 때 keyframe 주기(초). 0이면 사용 안 함 (켜면 array_encoding은 ndarray로 동작)
+def get_payload_codec(name=CODEC_JSON, array_encoding=ARRAY_ENCODING_STRING, array_delta=0):
+    delta = None
+    if array_delta:
+        _import_numpy()
+        delta = ArrayDeltaTracker(array_delta)
+    if name == CODEC_JSON:
+        return JsonPayloadCodec(array_encoding, delta)
+    if name == CODEC_MSGPACK:
+        try:
+            import msgpack
+        except ImportError:
+            raise ImportError("payload codec 'msgpack' needs the msgpack package (pip install msgpack)")
+        return BinaryPayloadCodec(
+            CODEC_MSGPACK, "application/msgpack",
+            lambda d: msgpack.packb(d, use_bin_type=True),
+            array_encoding, delta
+        )
+    if name == CODEC_CBOR:
+        try:
+            import cbor2
+        except ImportError:
+            raise ImportError("payload codec 'cbor' needs the cbor2 package (pip install cbor2)")
+        return BinaryPayloadCodec(CODEC_CBOR, "application/cbor", cbor2.dumps, array_encoding, delta)
+    raise ValueError(f"unknown payload codec: {name}")
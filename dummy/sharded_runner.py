@@ -0,0 +1,188 @@
+# sharded_runner.py
+# server_configs를 N개의 worker 프로세스로 나눠서 실행하는 러너
+# 각 worker는 자기 몫의 OPC UA 클라이언트들과 MQTT 연결 하나를 별도 이벤트 루프에서 돌림
+# supervisor(이 프로세스)는 죽은 worker를 다시 띄우고, worker별 통계를 모아서 출력함
+#
+# 실행: python sharded_runner.py --workers 4 [--config bridge.json]
+from sys import platform
+from os import name
+import argparse
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+
+import opcua_client_mqtt_publisher as bridge
+
+# worker가 통계를 보내는 주기(초)
+stats_interval = 5.0
+# worker 재시작 대기 시간(초): 연속으로 죽을수록 2배씩 늘어남
+restart_backoff_min = 1.0
+restart_backoff_max = 30.0
+# 이 시간(초) 이상 살아 있었던 worker가 죽으면 재시작 대기 시간을 처음부터 다시 셈
+restart_reset_after = 60.0
+
+
+# 노드 수가 많은 서버부터 가장 가벼운 shard에 넣어서 shard별 노드 수를 비슷하게 맞춤
+def split_server_configs(configs, workers):
+    shards = [[] for _ in range(workers)]
+    loads = [0] * workers
+    ordered = sorted(configs, key=lambda c: len(c["nodes_to_subscribe"] or []), reverse=True)
+    for config in ordered:
+        index = loads.index(min(loads))
+        shards[index].append(config)
+        loads[index] += max(1, len(config["nodes_to_subscribe"] or []))
+    return [shard for shard in shards if shard]
+
+
+####################################################################################
+# Worker:
+####################################################################################
+
+async def report_stats(worker_id, server_count, stats_queue):
+    while True:
+        await asyncio.sleep(stats_interval)
+        stats_queue.put({
+            "worker": worker_id,
+            "pid": os.getpid(),
+            "servers": server_count,
+            "queue": bridge.mqtt_queue.stats(),
+            "published": bridge.publish_stats["published"],
+            "errors": bridge.publish_stats["errors"],
+        })
+
+async def worker_async(worker_id, configs, stats_queue):
+    await asyncio.gather(
+        bridge.main(configs),
+        report_stats(worker_id, len(configs), stats_queue),
+    )
+
+def worker_main(worker_id, configs, broker_ip, broker_port, stats_queue, spool_path=None, metrics_port=None):
+    if platform.lower() == "win32" or name.lower() == "nt":
+        from asyncio import (
+            set_event_loop_policy,
+            WindowsSelectorEventLoopPolicy
+        )
+        set_event_loop_policy(WindowsSelectorEventLoopPolicy())
+    bridge.broker_ip = broker_ip
+    bridge.broker_port = broker_port
+    # worker마다 자기 spool 파일 (같은 파일을 쓰면 다른 worker의 메시지를 재전송/ack 하게 됨)
+    # worker_id는 재시작해도 같으므로 다시 뜬 worker가 자기 spool을 이어서 보냄
+    if spool_path:
+        bridge.spool_path = f"{spool_path}.w{worker_id}"
+    # worker마다 metrics 포트를 하나씩 (같은 포트면 하나만 bind에 성공하고 나머지는 죽어서 계속 재시작됨)
+    # worker N → metrics_port + N
+    bridge.metrics_port = metrics_port + worker_id if metrics_port else None
+    try:
+        asyncio.run(worker_async(worker_id, configs, stats_queue))
+    except KeyboardInterrupt:
+        pass
+
+
+####################################################################################
+# Supervisor:
+####################################################################################
+
+class WorkerSlot:
+    def __init__(self, worker_id, configs):
+        self.worker_id = worker_id
+        self.configs = configs
+        self.process = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.restart_at = None
+        self.stats = None
+
+
+def combine_stats(slots):
+    total = {"workers": 0, "servers": 0, "depth": 0, "dropped": 0, "high_water": 0, "published": 0, "errors": 0}
+    for slot in slots:
+        if slot.stats is None:
+            continue
+        total["workers"] += 1
+        total["servers"] += slot.stats["servers"]
+        total["depth"] += slot.stats["queue"]["depth"]
+        total["dropped"] += slot.stats["queue"]["dropped"]
+        total["high_water"] = max(total["high_water"], slot.stats["queue"]["high_water"])
+        total["published"] += slot.stats["published"]
+        total["errors"] += slot.stats["errors"]
+    return total
+
+
+def run_sharded(configs, workers, broker_ip, broker_port, spool_path=None, metrics_port=None):
+    ctx = multiprocessing.get_context("spawn")
+    stats_queue = ctx.Queue()
+    slots = [WorkerSlot(i, shard) for i, shard in enumerate(split_server_configs(configs, workers))]
+
+    def start(slot):
+        slot.process = ctx.Process(
+            target=worker_main,
+            args=(slot.worker_id, slot.configs, broker_ip, broker_port, stats_queue, spool_path, metrics_port),
+            name=f"bridge-worker-{slot.worker_id}",
+            daemon=True,
+        )
+        slot.process.start()
+        slot.started_at = time.monotonic()
+        slot.restart_at = None
+        print(f"[supervisor] worker {slot.worker_id} started (pid {slot.process.pid}, {len(slot.configs)} servers)")
+        if metrics_port:
+            print(f"[supervisor] worker {slot.worker_id} metrics on port {metrics_port + slot.worker_id}")
+
+    for slot in slots:
+        start(slot)
+
+    last_print = time.monotonic()
+    try:
+        while True:
+            try:
+                stats = stats_queue.get(timeout=1.0)
+                slots[stats["worker"]].stats = stats
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            for slot in slots:
+                if slot.restart_at is not None:
+                    if now >= slot.restart_at:
+                        slot.restarts += 1
+                        start(slot)
+                elif not slot.process.is_alive():
+                    if now - slot.started_at > restart_reset_after:
+                        slot.restarts = 0
+                    backoff = min(restart_backoff_max, restart_backoff_min * 2 ** slot.restarts)
+                    print(f"[supervisor] worker {slot.worker_id} exited (code {slot.process.exitcode}), restarting in {backoff:.0f}s")
+                    slot.stats = None
+                    slot.restart_at = now + backoff
+
+            if now - last_print >= stats_interval:
+                last_print = now
+                total = combine_stats(slots)
+                print(
+                    f"[supervisor] workers {total['workers']}/{len(slots)} | servers {total['servers']} | "
+                    f"published {total['published']} | errors {total['errors']} | "
+                    f"queue {total['depth']} (high {total['high_water']}, dropped {total['dropped']})"
+                )
+    except KeyboardInterrupt:
+        print("[supervisor] stopping workers...")
+    finally:
+        for slot in slots:
+            if slot.process is not None and slot.process.is_alive():
+                slot.process.terminate()
+        for slot in slots:
+            if slot.process is not None:
+                slot.process.join(timeout=5)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="run the OPC UA → MQTT bridge in several worker processes")
+    parser.add_argument("--config", help="bridge config file (.json / .toml / .yaml)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    args = parser.parse_args()
+    if args.config:
+        bridge.apply_config_file(args.config)
+
+    run_sharded(
+        bridge.server_configs, max(1, args.workers), bridge.broker_ip, bridge.broker_port,
+        bridge.spool_path, bridge.metrics_port
+    )
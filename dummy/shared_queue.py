@@ -1,8 +1,269 @@
 # shared_queue.py
 import asyncio
+from collections import deque
 
-# MQTT 퍼블리셔와 GUI가 공유할 비동기 큐
-send_queue = asyncio.Queue()
+# 큐가 가득 찼을 때의 처리 방식
+OVERFLOW_BLOCK = "block"                        # 공간이 생길 때까지 넣는 쪽(producer)을 기다리게 함
+OVERFLOW_DROP_OLDEST = "drop_oldest"            # 가장 오래된 메시지를 버리고 새 메시지를 넣음
+OVERFLOW_DROP_NEWEST = "drop_newest"            # 새로 들어온 메시지를 버림
+OVERFLOW_LATEST_PER_TOPIC = "latest_per_topic"  # 같은 topic이 큐에 있으면 그 값을 최신 값으로 덮어씀
+
+OVERFLOW_POLICIES = (
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_OLDEST,
+    OVERFLOW_DROP_NEWEST,
+    OVERFLOW_LATEST_PER_TOPIC,
+)
+
+# 메시지 우선순위 (MqttMessage.priority). 우선순위마다 큐 안에 별도 lane이 있음
+PRIORITY_ALARM = 0      # 이벤트/알람
+PRIORITY_HIGH = 1       # priority 태그로 지정한 노드
+PRIORITY_BULK = 2       # 나머지 값 변화
+PRIORITY_NAMES = {
+    "alarm": PRIORITY_ALARM,
+    "high": PRIORITY_HIGH,
+    "bulk": PRIORITY_BULK,
+}
+
+# 꺼낼 때의 lane별 가중치: 세 lane이 모두 차 있으면 alarm 8개, high 4개, bulk 1개 비율로 꺼냄
+# (bulk가 아무리 밀려 있어도 alarm은 바로 나가고, bulk도 멈추지는 않음)
+lane_weights = {
+    PRIORITY_ALARM: 8,
+    PRIORITY_HIGH: 4,
+    PRIORITY_BULK: 1,
+}
+
+# MQTT 퍼블리셔 consumer queue 설정 (운영 환경에 맞게 조정)
+send_queue_maxsize = 10000
+send_queue_policy = OVERFLOW_DROP_OLDEST
+# GUI consumer queue 설정. GUI가 느려도 producer/MQTT를 멈추지 않도록 block 정책은 쓰지 않음
+gui_queue_maxsize = 1000
+gui_queue_policy = OVERFLOW_DROP_OLDEST
+
+
+# 우선순위별 deque 묶음. len()은 전체 개수, popleft()는 가중치 순서로 다음 lane에서 꺼냄
+class PriorityLanes:
+    def __init__(self, weights):
+        self.lanes = {priority: deque() for priority in sorted(weights)}
+        # 가중치만큼 lane 번호를 섞어 놓은 순서 (예: 0 1 2 0 1 0 1 0 1 0 0 0 0)
+        self.schedule = []
+        remaining = dict(weights)
+        while any(remaining.values()):
+            for priority in sorted(remaining):
+                if remaining[priority]:
+                    self.schedule.append(priority)
+                    remaining[priority] -= 1
+        self.position = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, slot, priority):
+        lane = self.lanes.get(priority)
+        if lane is None:
+            lane = self.lanes[max(self.lanes)]
+        lane.append(slot)
+        self.count += 1
+
+    def popleft(self):
+        schedule = self.schedule
+        for _ in range(len(schedule)):
+            lane = self.lanes[schedule[self.position]]
+            self.position = (self.position + 1) % len(schedule)
+            if lane:
+                self.count -= 1
+                return lane.popleft()
+        raise IndexError("pop from empty PriorityLanes")
+
+    # 가장 낮은 우선순위 lane의 가장 오래된 항목 (넘칠 때 버릴 대상)
+    def pop_lowest(self, below=None):
+        for priority in sorted(self.lanes, reverse=True):
+            if below is not None and priority <= below:
+                break
+            lane = self.lanes[priority]
+            if lane:
+                self.count -= 1
+                return lane.popleft()
+        return None
+
+    def depths(self):
+        return {priority: len(lane) for priority, lane in self.lanes.items()}
+
+
+class BoundedSendQueue(asyncio.Queue):
+    """
+    asyncio.Queue with a maxsize, a selectable overflow policy and priority lanes.
+
+    Items go into the lane of their `priority` attribute (default PRIORITY_BULK);
+    get() serves the lanes by lane_weights. When the queue is full, the lowest
+    priority messages are dropped first.
+
+    Counters for sizing in production:
+      dropped    - messages discarded (or overwritten) because the queue was full
+      high_water - largest queue depth seen so far
+    """
+
+    def __init__(self, maxsize=send_queue_maxsize, policy=send_queue_policy):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy: {policy}")
+        if maxsize <= 0 and policy != OVERFLOW_BLOCK:
+            raise ValueError(f"policy {policy} needs a maxsize > 0")
+        super().__init__(maxsize)
+        self.policy = policy
+        self.dropped = 0
+        self.high_water = 0
+        # 넘칠 때 정책대로 버리기 전에 호출하는 함수 (queue를 받아서 비움). None이면 사용 안 함
+        # MQTT 퍼블리셔가 브로커에 연결되지 않은 동안 queue를 spool 파일로 옮기는 데 씀
+        self.spill = None
+        # 정책 때문에 버린(덮어쓴) 메시지를 받는 함수. None이면 사용 안 함
+        self.on_drop = None
+
+    # 큐 내부 저장 방식: 메시지를 [msg] 형태의 슬롯에 담아서,
+    # latest_per_topic 정책일 때 같은 topic 슬롯의 내용만 바꿔치기할 수 있게 함
+    def _init(self, maxsize):
+        self._queue = PriorityLanes(lane_weights)
+        self._slots = {}
+
+    def _put(self, item):
+        slot = [item]
+        self._queue.append(slot, getattr(item, "priority", PRIORITY_BULK))
+        topic = getattr(item, "topic", None)
+        if topic is not None:
+            self._slots[topic] = slot
+
+    def _forget(self, slot):
+        topic = getattr(slot[0], "topic", None)
+        if topic is not None and self._slots.get(topic) is slot:
+            del self._slots[topic]
+
+    def _get(self):
+        slot = self._queue.popleft()
+        self._forget(slot)
+        return slot[0]
+
+    # 넘칠 때 priority보다 낮은(숫자가 큰) lane에서 가장 오래된 메시지를 하나 버림. 버렸으면 True
+    def _drop_lower(self, priority=None):
+        slot = self._queue.pop_lowest(priority)
+        if slot is None:
+            return False
+        self._forget(slot)
+        self.task_done()
+        self._dropped(slot[0])
+        return True
+
+    def _dropped(self, item):
+        self.dropped += 1
+        if self.on_drop is not None:
+            self.on_drop(item)
+
+    async def put(self, item):
+        if self.spill is not None and self.full():
+            self.spill(self)
+        if self.policy == OVERFLOW_BLOCK:
+            await super().put(item)
+        else:
+            self.put_nowait(item)
+
+    def put_nowait(self, item):
+        if self.spill is not None and self.full():
+            self.spill(self)
+        if self.full():
+            priority = getattr(item, "priority", PRIORITY_BULK)
+            if self.policy == OVERFLOW_DROP_NEWEST:
+                # 새 메시지보다 우선순위가 낮은 메시지가 있으면 그것을 대신 버림
+                if not self._drop_lower(priority):
+                    self._dropped(item)
+                    return
+            elif self.policy == OVERFLOW_LATEST_PER_TOPIC:
+                slot = self._slots.get(getattr(item, "topic", None))
+                if slot is not None:
+                    replaced, slot[0] = slot[0], item
+                    self._dropped(replaced)
+                    return
+            if self.full() and self.policy != OVERFLOW_BLOCK:
+                # drop_oldest (latest_per_topic에서 같은 topic이 없을 때도 동일): 가장 낮은 우선순위부터 버림
+                self._drop_lower()
+        super().put_nowait(item)
+        if self.qsize() > self.high_water:
+            self.high_water = self.qsize()
+
+    def stats(self):
+        return {
+            "depth": self.qsize(),
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "dropped": self.dropped,
+            "high_water": self.high_water,
+            "lanes": self._queue.depths(),
+        }
+
+
+# producer(OPC UA 클라이언트, serial 등)가 넣은 메시지를 구독한 consumer마다 복사해서 넣는 버스
+# 예전에는 MQTT 퍼블리셔와 GUI가 queue 하나를 같이 꺼내 써서 메시지가 둘 중 한쪽에만 갔음
+class MessageBus:
+    """
+    Fan-out replacement for the single shared queue. Each consumer subscribes with
+    its own BoundedSendQueue (size, overflow policy, priority lanes) and an optional
+    accept filter; put() hands every message to each consumer that accepts it.
+
+    Only consumers with the block policy make put() wait. A consumer with a drop
+    policy (the GUI) that falls behind loses its own oldest messages, counted in its
+    `dropped` (lag) counter, without slowing the producers or the other consumers.
+    """
+
+    def __init__(self):
+        # 이름 → (queue, accept)
+        self.consumers = {}
+        self.published = 0
+        # 받을 consumer가 하나도 없었던 메시지 수
+        self.undelivered = 0
+
+    def subscribe(self, name, maxsize=send_queue_maxsize, policy=send_queue_policy, accept=None):
+        if name in self.consumers:
+            raise ValueError(f"consumer {name!r} is already subscribed")
+        queue = BoundedSendQueue(maxsize, policy)
+        self.consumers[name] = (queue, accept)
+        return queue
+
+    def unsubscribe(self, name):
+        self.consumers.pop(name, None)
+
+    async def put(self, item):
+        self.published += 1
+        delivered = False
+        for queue, accept in list(self.consumers.values()):
+            if accept is not None and not accept(item):
+                continue
+            delivered = True
+            if queue.policy == OVERFLOW_BLOCK:
+                await queue.put(item)
+            else:
+                queue.put_nowait(item)
+        if not delivered:
+            self.undelivered += 1
+
+    # block 정책 consumer가 꽉 차 있으면 어느 consumer에도 넣기 전에 QueueFull (일부 consumer만 받은 상태가 되지 않게)
+    def put_nowait(self, item):
+        queues = [queue for queue, accept in list(self.consumers.values()) if accept is None or accept(item)]
+        if any(queue.policy == OVERFLOW_BLOCK and queue.full() for queue in queues):
+            raise asyncio.QueueFull
+        self.published += 1
+        for queue in queues:
+            queue.put_nowait(item)
+        if not queues:
+            self.undelivered += 1
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "undelivered": self.undelivered,
+            "consumers": {name: queue.stats() for name, (queue, _) in self.consumers.items()},
+        }
+
+
+# 모든 producer가 넣는 버스 (이름은 예전 공유 queue와 같게 둠). consumer는 send_queue.subscribe()로 자기 queue를 받음
+send_queue = MessageBus()
 
 class MQTTStatusMessage:
     def __init__(self, status, broker, port, topics, detail=None):
@@ -14,9 +275,11 @@ class MQTTStatusMessage:
         from datetime import datetime
         self.time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.detail = detail
-        
+
 ##########
 # 사용 방법
-# 데이터 넣기   : await send_queue.put(메시지)
-# 데이터 꺼내기 : 메시지 = await send_queue.get()
-##########
\ No newline at end of file
+# 데이터 넣기   : await send_queue.put(메시지)                      → 구독한 모든 consumer queue에 들어감
+# 구독하기      : my_queue = send_queue.subscribe("gui", gui_queue_maxsize, gui_queue_policy)
+# 데이터 꺼내기 : 메시지 = await my_queue.get()
+# 상태 확인     : my_queue.stats()  → depth / dropped / high_water, send_queue.stats() → consumer별 stats
+##########
@@ -0,0 +1,62 @@
+# spool.py
+# MQTT 브로커에 연결되지 않은 동안 send_queue의 메시지를 디스크에 저장해 두는 store-and-forward 버퍼
+# SQLite WAL 모드 + 배치 insert로 초당 수만 건도 적은 쓰기량으로 처리하고,
+# 마지막으로 브로커 ACK를 받은 위치(offset)를 저장해서 프로세스를 다시 시작해도 이어서 보냄
+import sqlite3
+
+
+class MessageSpool:
+    """
+    Append-only message log on SQLite (WAL mode).
+
+    append() stores a batch in one transaction, read() returns the oldest
+    messages after the acknowledged offset in order, and ack() records the
+    new offset and deletes everything up to it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # WAL에서는 NORMAL이어도 프로세스가 죽었을 때 DB가 깨지지 않음 (OS가 죽으면 마지막 몇 배치만 잃을 수 있음)
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL, payload BLOB, qos INTEGER NOT NULL, "
+            "retain INTEGER NOT NULL DEFAULT 1)"
+        )
+        # retain 열이 없던 예전 파일 (그때는 모두 retain으로 보냈음)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(messages)")]
+        if "retain" not in columns:
+            self.db.execute("ALTER TABLE messages ADD COLUMN retain INTEGER NOT NULL DEFAULT 1")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.db.commit()
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'acked'").fetchone()
+        self.acked = row[0] if row else 0
+        self.pending = self.db.execute("SELECT COUNT(*) FROM messages WHERE id > ?", (self.acked,)).fetchone()[0]
+
+    def append(self, messages):
+        rows = [
+            (m.topic, m.payload.encode() if isinstance(m.payload, str) else m.payload, m.qos, bool(m.retain))
+            for m in messages
+        ]
+        with self.db:
+            self.db.executemany("INSERT INTO messages (topic, payload, qos, retain) VALUES (?, ?, ?, ?)", rows)
+        self.pending += len(rows)
+
+    # [(offset, topic, payload, qos, retain), ...] 오래된 순서
+    def read(self, limit):
+        return self.db.execute(
+            "SELECT id, topic, payload, qos, retain FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+            (self.acked, limit)
+        ).fetchall()
+
+    def ack(self, offset):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('acked', ?)", (offset,))
+            deleted = self.db.execute("DELETE FROM messages WHERE id <= ?", (offset,)).rowcount
+        self.acked = offset
+        self.pending -= deleted
+
+    def close(self):
+        self.db.close()
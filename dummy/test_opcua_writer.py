@@ -0,0 +1,61 @@
+# MQTT 쓰기 요청 회귀 테스트: python -m pytest test_opcua_writer.py
+import asyncio
+import json
+from types import SimpleNamespace
+
+from asyncua import ua
+
+import opcua_client_mqtt_publisher as bridge
+from shared_queue import send_queue
+
+
+class FakeUaClient:
+    def __init__(self):
+        self.written = []
+
+    async def write(self, params):
+        self.written.extend((str(v.NodeId.to_string()), v.Value.Value.Value) for v in params.NodesToWrite)
+        return [ua.StatusCode(ua.StatusCodes.Good) for _ in params.NodesToWrite]
+
+
+class FakeMqttClient:
+    def __init__(self, messages):
+        self._messages = messages
+
+    @property
+    async def messages(self):
+        for message in self._messages:
+            yield message
+
+
+def makeWriteMessage(nodeid, request, retain):
+    return SimpleNamespace(
+        topic=SimpleNamespace(value=f"demo/opcua-sub-to-mqtt/test/write/{nodeid}"),
+        payload=json.dumps(request).encode(),
+        retain=retain,
+    )
+
+
+def test_retained_write_is_not_written():
+    async def run():
+        queue = send_queue.subscribe("test", accept=lambda m: m.topic.endswith("/write-response"))
+        writer = bridge.OpcUaWriter("test", 0.01)
+        writer.client = SimpleNamespace(uaclient=FakeUaClient())
+        bridge.write_targets["test"] = writer
+        try:
+            writer.start()
+            await bridge.receive_writes(FakeMqttClient([
+                # 브로커에 retain으로 남아 있던 예전 명령 (구독할 때 retain 플래그와 함께 다시 옴)
+                makeWriteMessage("ns=2;i=3", {"Value": True, "VariantType": "Boolean", "RequestId": "old"}, True),
+                makeWriteMessage("ns=2;i=4", {"Value": 5, "VariantType": "Int32", "RequestId": "live"}, False),
+            ]))
+            message = await asyncio.wait_for(queue.get(), 2)
+            results = {r["RequestId"]: r["Status"]["Text"] for r in json.loads(message.payload)["Results"]}
+            assert results == {"old": "BadRequestNotAllowed", "live": "Good"}
+            assert writer.client.uaclient.written == [("ns=2;i=4", 5)]
+        finally:
+            writer.task.cancel()
+            del bridge.write_targets["test"]
+            send_queue.unsubscribe("test")
+
+    asyncio.run(run())
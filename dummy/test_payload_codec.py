@@ -0,0 +1,129 @@
+# array delta 회귀 테스트: python -m pytest test_payload_codec.py
+import asyncio
+import base64
+import json
+from types import SimpleNamespace
+
+import numpy as np
+from asyncua import ua
+
+from payload_codec import CODEC_JSON, get_payload_codec
+from opcua_client_mqtt_publisher import NodeInfo, SubscriptionHandler, TopicCoalescer, forget_dropped_delta
+from shared_queue import BoundedSendQueue, OVERFLOW_DROP_NEWEST, send_queue
+
+
+def makeNotification(client_handle, values):
+    dv = ua.DataValue(ua.Variant(values, ua.VariantType.Double))
+    return SimpleNamespace(monitored_item=SimpleNamespace(ClientHandle=client_handle, Value=dv))
+
+
+def makeHandler(codec, nodeid, coalescer=None):
+    handler = SubscriptionHandler("test", coalescer, codec)
+    # asyncua는 subscription마다 client handle을 201부터 매김 → 두 subscription의 첫 노드가 같은 handle
+    handler.node_table[201] = NodeInfo(f"demo/opcua-sub-to-mqtt/test/variables/{nodeid}", nodeid)
+    return handler
+
+
+def received(queue):
+    messages = []
+    while not queue.empty():
+        message = queue.get_nowait()
+        block = json.loads(message.payload)["Value"]["Value"]
+        messages.append((message.topic.rsplit("/", 1)[1], block, message.retain))
+    return messages
+
+
+def applyDelta(array, block):
+    data = np.frombuffer(base64.b64decode(block["Data"]), block["DType"])
+    result = array.copy().ravel()
+    offset = 0
+    for start, end in block["Ranges"]:
+        result[start:end] = data[offset:offset + end - start]
+        offset += end - start
+    return result.reshape(block["Shape"])
+
+
+def test_delta_per_node_across_subscriptions():
+    async def run():
+        queue = send_queue.subscribe("test")
+        try:
+            codec = get_payload_codec(CODEC_JSON, array_delta=60)
+            slow = makeHandler(codec, "ns=2;s=Slow")
+            fast = makeHandler(codec, "ns=2;s=Fast")
+            a = [float(i) for i in range(100)]
+            b = [float(-i) for i in range(100)]
+
+            await slow.datachange_notification(None, None, makeNotification(201, a))
+            await fast.datachange_notification(None, None, makeNotification(201, b))
+            # 같은 handle이어도 노드마다 따로 keyframe
+            first = received(queue)
+            assert [(nodeid, block.get("Keyframe"), retain) for nodeid, block, retain in first] == [
+                ("ns=2;s=Slow", True, True),
+                ("ns=2;s=Fast", True, True),
+            ]
+
+            # 값이 그대로면 보내지 않고, 바뀐 값은 그 노드의 이전 값에 대한 delta (retain 안 함)
+            await slow.datachange_notification(None, None, makeNotification(201, a))
+            changed = list(b)
+            changed[7] = 7.5
+            await fast.datachange_notification(None, None, makeNotification(201, changed))
+            second = received(queue)
+            assert len(second) == 1
+            nodeid, block, retain = second[0]
+            assert nodeid == "ns=2;s=Fast"
+            assert block["Encoding"] == "ndarray-delta"
+            assert block["Seq"] == 1
+            assert retain is False
+            assert applyDelta(np.array(b), block).tolist() == changed
+        finally:
+            send_queue.unsubscribe("test")
+
+    asyncio.run(run())
+
+
+def test_delta_with_coalescer():
+    async def run():
+        queue = BoundedSendQueue(100)
+        coalescer = TopicCoalescer(0.2, queue)
+        handler = makeHandler(get_payload_codec(CODEC_JSON, array_delta=60), "ns=2;s=Array", coalescer)
+        values = [float(i) for i in range(100)]
+
+        await handler.datachange_notification(None, None, makeNotification(201, values))
+        await coalescer.flush()
+        [(_, keyframe, _)] = received(queue)
+        assert keyframe["Keyframe"] is True and keyframe["Seq"] == 0
+
+        # 한 window 안의 변경 3번 → 마지막 값 하나만, 직전에 보낸 keyframe 기준 delta (Seq 1)
+        changed = list(values)
+        for i in (3, 50, 90):
+            changed[i] = -1.0
+            await handler.datachange_notification(None, None, makeNotification(201, list(changed)))
+        await coalescer.flush()
+        [(_, block, retain)] = received(queue)
+        assert block["Encoding"] == "ndarray-delta"
+        assert block["Seq"] == 1
+        assert retain is False
+        assert applyDelta(np.array(values), block).tolist() == changed
+
+    asyncio.run(run())
+
+
+def test_keyframe_after_dropped_delta():
+    queue = BoundedSendQueue(1, OVERFLOW_DROP_NEWEST)
+    queue.on_drop = forget_dropped_delta
+    handler = makeHandler(get_payload_codec(CODEC_JSON, array_delta=60), "ns=2;s=Array")
+    info = handler.node_table[201]
+    values = [float(i) for i in range(100)]
+
+    queue.put_nowait(handler.make_message(info, ua.DataValue(ua.Variant(values)), None))
+    values[5] = -1.0
+    # queue가 꽉 차서 delta(Seq 1)는 버려짐
+    queue.put_nowait(handler.make_message(info, ua.DataValue(ua.Variant(values)), None))
+    assert queue.dropped == 1
+    received(queue)
+
+    values[6] = -1.0
+    queue.put_nowait(handler.make_message(info, ua.DataValue(ua.Variant(values)), None))
+    [(_, block, retain)] = received(queue)
+    assert block["Keyframe"] is True and block["Seq"] == 2
+    assert retain is True